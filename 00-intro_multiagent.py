@@ -1,4 +1,9 @@
 import asyncio
+import difflib
+import json
+import os
+import re
+import time
 
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
@@ -11,14 +16,17 @@ from semantic_kernel.agents.strategies import (
     KernelFunctionTerminationStrategy,
 )
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
-from semantic_kernel.contents import ChatHistoryTruncationReducer
+from semantic_kernel.contents import ChatHistory, ChatHistoryTruncationReducer, ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
 
 from semantic_kernel.functions import KernelFunctionFromPrompt
 
 ################################################
 # Tracing dans le fichier telemetry : configuration des logs et connexion App Insights
 from telemetry import set_up_logging, set_up_metrics, set_up_tracing
+from checkpoint_store import create_checkpoint_store
 
 set_up_logging()
 set_up_tracing()
@@ -50,6 +58,175 @@ termination_function = KernelFunctionFromPrompt(
 )
 # réduction de l'historque pour la fonction de terminaison
 history_reducer = ChatHistoryTruncationReducer(target_count=2)
+MAXIMUM_ITERATIONS = 10
+################################################
+
+################################################
+# Terminaison à deux niveaux: une vérification locale (regex + similarité) tranche les cas évidents,
+# le LLM juge n'est appelé que si elle ne permet pas de conclure
+AGREEMENT_PHRASE = "je suis d'accord"
+AGREEMENT_PATTERN = re.compile(r"\bje suis (?:tout à fait |totalement |bien |donc )?d'accord\b")
+DISAGREEMENT_PATTERN = re.compile(r"\b(?:pas|plus|jamais) (?:du tout |tout à fait |encore )?d'accord\b")
+
+
+def local_termination_check(content: str) -> bool | None:
+    """True/False when the message obviously agrees or not, None when the LLM judge must decide."""
+    text = " ".join((content or "").lower().replace("’", "'").split())
+    if DISAGREEMENT_PATTERN.search(text):
+        return False
+    if AGREEMENT_PATTERN.search(text):
+        return True
+
+    # similarité approximative (fautes de frappe, ponctuation...) sur des fenêtres de la taille de la phrase
+    size = len(AGREEMENT_PHRASE)
+    best = max((difflib.SequenceMatcher(None, AGREEMENT_PHRASE, text[i:i + size]).ratio()
+                for i in range(max(1, len(text) - size + 1))), default=0.0)
+    if best >= 0.9:
+        return True
+    if best < 0.6 and "accord" not in text:
+        return False
+    return None
+
+
+class TieredTerminationStrategy(KernelFunctionTerminationStrategy):
+    """KernelFunctionTerminationStrategy with a local pre-check before the LLM judge."""
+
+    judge_calls: int = 0
+    judge_calls_avoided: int = 0
+
+    async def should_agent_terminate(self, agent, history):
+        decision = local_termination_check(history[-1].content if history else "")
+        if decision is not None:
+            self.judge_calls_avoided += 1
+            return decision
+        self.judge_calls += 1
+        return await super().should_agent_terminate(agent, history)
+################################################
+
+################################################
+# Affichage en streaming des tours de parole: une bulle par tour, remplie token par token
+class TurnRenderer:
+    def __init__(self, min_display_interval: float = 0.0, on_commit=None):
+        # durée minimale d'affichage d'un tour (0 = pas de pause): seuls les tours plus courts sont complétés
+        self.min_display_interval = min_display_interval
+        self.on_commit = on_commit
+        self.name = None
+        self.parts = []
+        self.bubble = None
+        self.placeholder = None
+        self.started_at = 0.0
+
+    async def add(self, chunk, name: str | None = None):
+        name = name or chunk.name
+        if name != self.name:
+            await self.finish()
+            self.name = name
+            self.bubble = st.empty()
+            self.placeholder = self.bubble.chat_message(self.name, avatar=avatars.get(self.name, None)).empty()
+            self.started_at = time.perf_counter()
+        if chunk.content:
+            self.parts.append(chunk.content)
+            self.placeholder.markdown("".join(self.parts))
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    async def finish(self):
+        if self.name is None:
+            return
+        st.session_state.messages.append({"role": self.name, "content": self.content})
+        self.name, self.parts = None, []
+        if self.on_commit is not None:
+            self.on_commit()
+        remaining = self.min_display_interval - (time.perf_counter() - self.started_at)
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    def discard(self) -> int:
+        """Removes the current (speculative) turn from the page, returns the number of chunks thrown away."""
+        if self.bubble is not None:
+            self.bubble.empty()
+        discarded = len(self.parts)
+        self.name, self.parts, self.bubble = None, [], None
+        return discarded
+################################################
+
+################################################
+# Exécution spéculative: le tour suivant démarre pendant que la terminaison est évaluée,
+# il est annulé (et effacé) si le juge décide d'arrêter la conversation
+class SpeculationStats:
+    def __init__(self):
+        self.discarded_turns = 0
+        self.wasted_tokens = 0
+        self.saved_seconds = 0.0
+
+
+async def stream_turn(agent, messages, renderer: TurnRenderer) -> ChatMessageContent:
+    # l'agent répond sur une copie de l'historique: rien n'est ajouté tant que le tour n'est pas accepté
+    async for chunk in agent.invoke_stream(ChatHistory(messages=list(messages))):
+        await renderer.add(chunk, name=agent.name)
+    return ChatMessageContent(role=AuthorRole.ASSISTANT, name=agent.name, content=renderer.content)
+
+
+async def invoke_speculative(chat: AgentGroupChat, renderer: TurnRenderer, stats: SpeculationStats):
+    strategy = chat.termination_strategy
+    history = chat.history
+    agent = await chat.selection_strategy.next(chat.agents, history.messages)
+    turn = asyncio.create_task(stream_turn(agent, history.messages, renderer))
+    judge = None
+    try:
+        for iteration in range(strategy.maximum_iterations):
+            history.add_message(await turn)
+            await renderer.finish()
+            if iteration == strategy.maximum_iterations - 1:
+                break
+
+            # juge et tour suivant en parallèle, sur le même état de l'historique
+            next_agent = await chat.selection_strategy.next(chat.agents, history.messages)
+            judge = asyncio.create_task(strategy.should_terminate(agent, list(history.messages)))
+            turn = asyncio.create_task(stream_turn(next_agent, history.messages, renderer))
+            judge_started = time.perf_counter()
+            should_stop = await judge
+            if should_stop:
+                turn.cancel()
+                await asyncio.gather(turn, return_exceptions=True)
+                stats.discarded_turns += 1
+                stats.wasted_tokens += renderer.discard()
+                break
+            # le temps du juge a été recouvert par la génération du tour suivant
+            stats.saved_seconds += time.perf_counter() - judge_started
+            agent = next_agent
+    finally:
+        # juge ou tour en erreur, rerun: la tâche encore en cours est annulée et attendue, jamais abandonnée
+        pending = [task for task in (judge, turn) if task is not None and not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+################################################
+
+################################################
+# Points de reprise: historique compact (nom, contenu) + nombre de tours + conversation terminée ou non
+CHECKPOINT_NAMESPACE = "multiagent"
+
+
+@st.cache_resource
+def get_checkpoint_store():
+    return create_checkpoint_store(os.getenv("MULTIAGENT_CHECKPOINT_DB"))
+
+
+def save_checkpoint(store, conversation_id: str, messages, complete: bool):
+    data = {"messages": [[m.name, m.content] for m in messages], "iterations": len(messages), "complete": complete}
+    store.put(CHECKPOINT_NAMESPACE, conversation_id, json.dumps(data, ensure_ascii=False))
+
+
+def load_checkpoint(store, conversation_id: str) -> dict | None:
+    if (raw := store.get(CHECKPOINT_NAMESPACE, conversation_id)) is None:
+        return None
+    data = json.loads(raw)
+    history = [ChatMessageContent(role=AuthorRole.ASSISTANT, name=name, content=content)
+               for name, content in data["messages"]]
+    return {"history": history, "complete": data["complete"] or len(history) >= MAXIMUM_ITERATIONS}
 ################################################
 
 async def main():
@@ -57,9 +234,21 @@ async def main():
     ################################################
     # streamlit interface, pas important
     st.title("Intro Semantic Kernel - Multi-agent chat")
-    # Initialize chat history
-    if "messages" not in st.session_state:
+    min_display_interval = st.sidebar.slider("Durée minimale d'un tour (s)", min_value=0.0, max_value=5.0, value=0.0, step=0.5)
+    speculative = st.sidebar.toggle("Exécution spéculative", value=False)
+
+    # Point de reprise de la conversation (session, ou fichier SQLite si MULTIAGENT_CHECKPOINT_DB est défini)
+    store = get_checkpoint_store()
+    conversation_id = st.query_params.get("conversation", get_script_run_ctx().session_id)
+    checkpoint = load_checkpoint(store, conversation_id)
+    if st.sidebar.button("Recommencer la conversation"):
+        store.delete(CHECKPOINT_NAMESPACE, conversation_id)
         st.session_state.messages = []
+        checkpoint = None
+
+    # Initialize chat history
+    if "messages" not in st.session_state or (checkpoint and not st.session_state.messages):
+        st.session_state.messages = [{"role": m.name, "content": m.content} for m in checkpoint["history"]] if checkpoint else []
 
     # Display chat messages from history on app rerun
     for message in st.session_state.messages:
@@ -67,6 +256,11 @@ async def main():
             st.markdown(message["content"])
     ################################################
 
+    # conversation déjà terminée: rien à rejouer, aucun appel au LLM
+    if checkpoint and checkpoint["complete"]:
+        return
+    history = checkpoint["history"] if checkpoint else []
+
     # Creation du kernel
     kernel = Kernel()
 
@@ -81,25 +275,41 @@ async def main():
     bootcamp_agent = ChatCompletionAgent(kernel=kernel, name=bootcamp_agent_name, instructions=BOOTCAMP_AGENT_INSTRUCTIONS)
     presenter_agent = ChatCompletionAgent(kernel=kernel, name=present_agent_name, instructions=PRESENTER_AGENT_INSTRUCTIONS)
 
+    # en cas de reprise, l'ordre des agents est décalé pour que la sélection séquentielle reparte du bon agent
+    agents = [bootcamp_agent, presenter_agent]
+    agents = agents[len(history) % 2:] + agents[:len(history) % 2]
 
     # Définition de la "chat room" pour agent
-    chat = AgentGroupChat(agents=[bootcamp_agent, presenter_agent], # les agents
-                          termination_strategy=KernelFunctionTerminationStrategy(agents=[bootcamp_agent], # comment ça se termine cette histoire ?
-                                                                                 function=termination_function,
-                                                                                 kernel=kernel,
-                                                                                 result_parser=lambda result: termination_keyword in str(result.value[0]).lower(),
-                                                                                 history_variable_name="lastmessage",
-                                                                                 maximum_iterations=10,
-                                                                                 history_reducer=history_reducer),
+    chat = AgentGroupChat(agents=agents, # les agents
+                          termination_strategy=TieredTerminationStrategy(agents=[bootcamp_agent], # comment ça se termine cette histoire ?
+                                                                         function=termination_function,
+                                                                         kernel=kernel,
+                                                                         result_parser=lambda result: termination_keyword in str(result.value[0]).lower(),
+                                                                         history_variable_name="lastmessage",
+                                                                         maximum_iterations=MAXIMUM_ITERATIONS - len(history),
+                                                                         history_reducer=history_reducer),
                           )
+    for message in history:
+        chat.history.add_message(message)
 
     # Lancement de la boucle de chat (l'hisorique est gérré par le kernel)
-    async for response in chat.invoke():
-        # affichage du message (response.content) avec le role (response.name)
-        with st.chat_message(response.name, avatar=avatars.get(response.name, None)):
-            st.markdown(response.content)
-            st.session_state.messages.append({"role": response.name, "content": response.content})
-        await asyncio.sleep(3.0)
+    # les réponses arrivent en streaming, chaque chunk porte le nom de l'agent (response.name)
+    # un point de reprise est enregistré après chaque tour accepté
+    renderer = TurnRenderer(min_display_interval,
+                            on_commit=lambda: save_checkpoint(store, conversation_id, chat.history.messages, complete=False))
+    if speculative:
+        stats = SpeculationStats()
+        await invoke_speculative(chat, renderer, stats)
+        st.sidebar.caption(f"Spéculation: {stats.saved_seconds:.1f} s de juge masquées, "
+                           f"{stats.discarded_turns} tour(s) jeté(s), ~{stats.wasted_tokens} tokens perdus")
+    else:
+        async for response in chat.invoke_stream():
+            await renderer.add(response)
+        await renderer.finish()
+    save_checkpoint(store, conversation_id, chat.history.messages, complete=True)
+
+    strategy = chat.termination_strategy
+    st.sidebar.caption(f"Juge LLM: {strategy.judge_calls} appels, {strategy.judge_calls_avoided} évités")
 
 
 if __name__ == "__main__":
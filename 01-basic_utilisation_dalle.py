@@ -7,6 +7,10 @@ from semantic_kernel.contents.chat_history import ChatHistory
 
 import streamlit as st
 
+from image_store import ImageStore, request_key
+from rate_limit import AsyncRateLimiter
+from services import get_registry
+
 ################################################
 # Tracing dans le fichier telemetry : configuration des logs et connexion App Insights
 from telemetry import set_up_logging, set_up_metrics, set_up_tracing
@@ -30,6 +34,37 @@ chat_settings = AzureChatPromptExecutionSettings(
 )
 ################################################
 
+################################################
+# Stockage local des images générées (adressé par le contenu, avec miniatures)
+@st.cache_resource
+def get_image_store():
+    return ImageStore(root=".image_store")
+
+
+# limiteur partagé par tous les prompts et toutes les sessions: une pause sur 429 s'applique à tous les appels
+@st.cache_resource
+def get_rate_limiter():
+    return AsyncRateLimiter(max_concurrency=8)
+################################################
+
+################################################
+# Génération d'une variante (taille, numéro) en passant par le limiteur de débit
+SIZES = {"1024x1024": (1024, 1024), "1792x1024": (1792, 1024), "1024x1792": (1024, 1792)}
+
+
+async def generate_variant(index, prompt, size, variant, image_generation, limiter, concurrency, store):
+    width, height = SIZES[size]
+    key = request_key(prompt, width, height, variant)
+    # même prompt, même taille et même variante: l'image est servie depuis le stockage local
+    if (stored := store.get(key)) is None:
+        registry = get_registry()
+        img_link = await limiter.run(lambda: registry.call(image_generation.generate_image(prompt, width, height)),
+                                     semaphore=concurrency)
+        # téléchargement unique de l'image, puis miniature
+        stored = await asyncio.to_thread(store.put_url, key, img_link)
+    return index, stored
+################################################
+
 
 ################################################
 # Fonction main (async)
@@ -51,20 +86,35 @@ async def main():
     # objet pour l'historique
     # history = ChatHistory()
 
+    # Le service est créé une seule fois par processus et réutilisé pour tous les prompts
+    registry = get_registry()
+    image_generation = registry.get_service(
+        "text-to-image",
+        lambda: AzureTextToImage(service_id="text-to-image",
+                                 deployment_name="dall-e-3",
+                                 async_client=registry.azure_openai_client("2024-05-01-preview"))
+    )
+
 
     ################################################
     # streamlit interface, pas important
     st.title("Semantic Kernel - Dall-E3")
+    nb_variants = st.sidebar.number_input("Variantes par taille", min_value=1, max_value=4, value=1)
+    sizes = st.sidebar.multiselect("Tailles", list(SIZES), default=["1024x1024"]) or ["1024x1024"]
+    max_concurrency = st.sidebar.slider("Générations en parallèle", min_value=1, max_value=8, value=3)
     # Initialize chat history
     if "messages" not in st.session_state:
         st.session_state.messages = []
-        st.session_state.img_links = []
+        st.session_state.img_paths = []
 
     # Display chat messages from history on app rerun
+    # (les images viennent du disque local: pas de re-téléchargement, pas d'URL expirée)
     for i, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
-        st.image(st.session_state.img_links[i])
+        if paths := (st.session_state.img_paths[i] if i < len(st.session_state.img_paths) else []):
+            for column, path in zip(st.columns(len(paths)), paths):
+                column.image(path)
     ################################################
 
     ################################################
@@ -73,16 +123,35 @@ async def main():
     if prompt := st.chat_input("Générer une image ici..."):
         st.chat_message("user").markdown(prompt)
         st.session_state.messages.append({"role": "user", "content": prompt})
+        # liste des miniatures ajoutée avec le message: un rerun pendant la génération garde les deux listes alignées
+        prompt_paths = []
+        st.session_state.img_paths.append(prompt_paths)
         ################################################
 
 
-        image_generation = AzureTextToImage(service_id="text-to-image",
-                                        deployment_name="dall-e-3",
-                                        api_version="2024-05-01-preview")
-
-        img_link = await image_generation.generate_image(prompt, 1024, 1024)
-        st.image(img_link)
-        st.session_state.img_links.append(img_link)
+        # Toutes les variantes sont générées en parallèle (dall-e-3 ne produit qu'une image par appel),
+        # avec un nombre limité d'appels simultanés et une pause commune en cas de 429
+        store = get_image_store()
+        limiter = get_rate_limiter()
+        concurrency = asyncio.Semaphore(max_concurrency)
+        jobs = [(size, variant) for size in sizes for variant in range(nb_variants)]
+        placeholders = [column.empty() for column in st.columns(len(jobs))]
+        for placeholder, (size, _) in zip(placeholders, jobs):
+            placeholder.caption(f"{size}...")
+
+        # affichage de chaque image dès qu'elle est prête
+        thumbnails = [None] * len(jobs)
+        tasks = [generate_variant(i, prompt, size, variant, image_generation, limiter, concurrency, store)
+                 for i, (size, variant) in enumerate(jobs)]
+        for task in asyncio.as_completed(tasks):
+            try:
+                index, stored = await task
+            except Exception as exc:
+                st.error(f"Erreur de génération: {exc}")
+                continue
+            placeholders[index].image(stored.path)
+            thumbnails[index] = stored.thumbnail_path
+        prompt_paths.extend(path for path in thumbnails if path is not None)
 
 
 
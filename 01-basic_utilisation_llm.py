@@ -1,12 +1,18 @@
 import asyncio
+import os
 
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureChatPromptExecutionSettings
 
 from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.chat_message_content import ChatMessageContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
 
 import streamlit as st
 
+from llm_cache import ResponseCache, make_cache_key
+from services import get_registry
+
 ################################################
 # Tracing dans le fichier telemetry : configuration des logs et connexion App Insights
 from telemetry import set_up_logging, set_up_metrics, set_up_tracing
@@ -30,6 +36,25 @@ chat_settings = AzureChatPromptExecutionSettings(
 )
 ################################################
 
+################################################
+# Cache des réponses du LLM (partagé entre les sessions du serveur)
+# LLM_CACHE_DB: fichier SQLite optionnel pour garder les réponses entre deux lancements
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256")),
+                         ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+                         db_path=os.getenv("LLM_CACHE_DB") or None)
+################################################
+
+
+################################################
+# Génération en streaming: le texte est affiché dès le premier token
+async def stream_answer(chat_completion, history, placeholder) -> ChatMessageContent:
+    stream = chat_completion.get_streaming_chat_message_content(chat_history=history, settings=chat_settings)
+    content = await get_registry().stream_text(stream, placeholder.markdown, {"service": "chat-completion"})
+    return ChatMessageContent(role=AuthorRole.ASSISTANT, content=content)
+################################################
+
 
 ################################################
 # Fonction main (async)
@@ -44,19 +69,29 @@ async def main():
     # Connexion information are in .env file
     # Voir .env.example
     # instruction role => system prompt
-    chat_completion = AzureChatCompletion(service_id="chat-completion",
-                                          instruction_role="Tu es un super assistant, aide l'utilisateur au mieux.") #.env environment is parsed automatically
+    # Le service est créé une seule fois par processus (registre partagé entre les reruns et les sessions)
+    # et utilise le client HTTP du registre: les connexions restent ouvertes d'un tour à l'autre
+    registry = get_registry()
+    chat_completion = registry.get_service(
+        "chat-completion",
+        lambda: AzureChatCompletion(service_id="chat-completion",
+                                    instruction_role="Tu es un super assistant, aide l'utilisateur au mieux.", #.env environment is parsed automatically
+                                    async_client=registry.azure_openai_client())
+    )
 
     # service ajouté au kernel non obligatoire
     # kernel.add_service(chat_completion)
 
-    # objet pour l'historique
-    history = ChatHistory()
+    # objet pour l'historique, gardé dans la session pour conserver le contexte de la conversation
+    if "history" not in st.session_state:
+        st.session_state.history = ChatHistory()
+    history = st.session_state.history
 
 
     ################################################
     # streamlit interface, pas important
     st.title("Semantic Kernel - Sans kernel, utilisation d'un LLM")
+    streaming = st.sidebar.toggle("Streaming", value=True)
     # Initialize chat history
     if "messages" not in st.session_state:
         st.session_state.messages = []
@@ -79,22 +114,34 @@ async def main():
         # history.add_message({"role": "user", "content": prompt})
         history.add_user_message(prompt)
 
-        # génération de la réponse par le LLM
-        result = await chat_completion.get_chat_message_content(
-            chat_history=history,
-            settings=chat_settings
-            # kernel=kernel
-        )
+        # génération de la réponse par le LLM (ou récupération dans le cache)
+        cache = get_response_cache()
+        cache_key = make_cache_key(history, chat_settings)
+        with st.chat_message("assistant"):
+            if (cached := cache.get(cache_key)) is not None:
+                result = ChatMessageContent(role=AuthorRole.ASSISTANT, content=cached)
+                st.markdown(result.content)
+            elif streaming:
+                # affichage des tokens au fur et à mesure de leur arrivée
+                result = await stream_answer(chat_completion, history, st.empty())
+            else:
+                result = await registry.call(chat_completion.get_chat_message_content(
+                    chat_history=history,
+                    settings=chat_settings
+                    # kernel=kernel
+                ))
+                st.markdown(result.content)
+        if result.content and cached is None:
+            cache.put(cache_key, result.content)
 
         # ajout de la réponse du llm à l'historique
         history.add_message(result)
 
         ################################################
-        # Affichage de la réponse du LLM
-        with st.chat_message("assistant"):
-            st.markdown(result.content)
         # Add assistant response to chat history
         st.session_state.messages.append({"role": "assistant", "content": result.content})
+        stats = cache.stats()
+        st.sidebar.caption(f"Cache: {stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.0%})")
         ################################################
 
 
@@ -1,5 +1,7 @@
 import asyncio
+import json
 import sys
+import time
 #import dotenv
 #import logging
 
@@ -13,6 +15,7 @@ from typing import Annotated
 from semantic_kernel.functions import kernel_function
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
 from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.filters import AutoFunctionInvocationContext, FilterTypes
 
 from semantic_kernel.connectors.ai.open_ai.prompt_execution_settings.azure_chat_prompt_execution_settings import (
     AzureChatPromptExecutionSettings,
@@ -22,26 +25,101 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 
+from point_store import ChartDownsampler, PointStore
+from history_budget import TokenBudgetReducer
+
+# nombre maximal de points renvoyés au modèle en une fois
+MAX_POINTS_PER_PAGE = 200
+
 ################################################
 # déclaration du plugin (des points x,y)
+# les points sont rangés en colonnes (tableaux numpy) dans un PointStore:
+# le modèle peut en ajouter/supprimer par lots et ne récupère que ce dont il a besoin (résumé, page, filtre)
 class PointsPlugin:
     #def __init__(self, points, plot):
-    def __init__(self, points):
+    def __init__(self, points: PointStore, point_budget: int = 5000):
         self.points = points
         self.plot = None
+        self.placeholder = None
+        # au-delà de point_budget points, le graphique reçoit une version sous-échantillonnée (un point par case)
+        self.downsampler = ChartDownsampler(point_budget)
+        self.last_render = {}
+        # les points ajoutés ne sont envoyés au graphique qu'une fois par réponse du modèle (voir flush)
+        self.rendered = 0
+        self.chart_updates = 0
+        self.tool_calls = 0
+        self._completed_calls = {}
 
     def scatter_plot(self):
-        self.plot = st.scatter_chart(st.session_state.points.points, x="x", y="y")
+        self.placeholder = st.empty()
+        self.redraw()
+
+    def redraw(self):
+        start = time.perf_counter()
+        frame = self.downsampler.full(self.points)
+        self.plot = self.placeholder.scatter_chart(frame, x="x", y="y")
+        self.rendered = len(self.points)
+        self._measure("full", frame, start)
+
+    def flush(self):
+        """Sends the points added since the last update to the chart, in a single add_rows."""
+        if self.plot is None or self.rendered >= len(self.points):
+            return
+        start = time.perf_counter()
+        frame = self.downsampler.delta(self.points, self.rendered)
+        if frame is None:
+            # budget dépassé: le graphique est redessiné avec un nouvel échantillonnage
+            self.redraw()
+        else:
+            if len(frame):
+                self.plot.add_rows(frame)
+            self.rendered = len(self.points)
+            self._measure("delta", frame, start)
+        self.chart_updates += 1
+
+    def _measure(self, kind: str, frame: pd.DataFrame, start: float):
+        # taille approximative envoyée au navigateur (deux colonnes float64) et temps de préparation/rendu
+        payload_bytes = int(frame.memory_usage(index=False).sum())
+        seconds = time.perf_counter() - start
+        chart_payload_bytes.record(payload_bytes, {"kind": kind})
+        chart_render_time.record(seconds, {"kind": kind})
+        self.last_render = {"kind": kind, "rows": len(frame), "points": len(self.points),
+                            "bytes": payload_bytes, "ms": 1000 * seconds}
+
+    async def auto_function_invocation_filter(self, context: AutoFunctionInvocationContext, next):
+        # tous les appels d'une même réponse du modèle sont exécutés ensemble (asyncio.gather dans semantic kernel):
+        # le graphique est mis à jour quand le dernier appel du lot est terminé (même en erreur: le compteur est libéré)
+        try:
+            await next(context)
+        finally:
+            self.tool_calls += 1
+            key = context.request_sequence_index
+            self._completed_calls[key] = self._completed_calls.get(key, 0) + 1
+            if self._completed_calls[key] >= context.function_count:
+                del self._completed_calls[key]
+                self.flush()
 
     @kernel_function(
         name="get_points",
-        description="Gets a list of points with their coordinates",
+        description="Gets the points: a summary (count, bounding box, mean) or a page of points with their index and coordinates, optionally filtered by bounds",
     )
     def get_points(
         self,
+        mode: Annotated[str, "'summary' (default) or 'list'"] = "summary",
+        offset: Annotated[int, "index of the first point of the page (list mode)"] = 0,
+        limit: Annotated[int, "maximum number of points returned (list mode)"] = 50,
+        x_min: Annotated[float | None, "minimum x"] = None,
+        x_max: Annotated[float | None, "maximum x"] = None,
+        y_min: Annotated[float | None, "minimum y"] = None,
+        y_max: Annotated[float | None, "maximum y"] = None,
     ) -> str:
-        """Gets a list of points with their coordinates"""
-        return self.points
+        """Gets a summary or a page of the points with their coordinates"""
+        indices = self.points.filter(x_min, x_max, y_min, y_max)
+        if mode != "list":
+            return json.dumps(self.points.summary(indices))
+        limit = max(0, min(limit, MAX_POINTS_PER_PAGE))
+        page = indices[offset:offset + limit]
+        return json.dumps({"total": int(len(indices)), "offset": offset, "points": self.points.rows(page)})
 
     @kernel_function(
         name="add_point",
@@ -53,17 +131,91 @@ class PointsPlugin:
         y: float,
     ) -> str:
         """"Add a point to the list"""
-        new_point = {"x": x, "y": y}
-        self.points.append(new_point)
-        self.plot.add_rows(pd.DataFrame([new_point]))
-        return self.points
+        return self.add_points([x], [y])
+
+    @kernel_function(
+        name="add_points",
+        description="Add several points at once, xs[i] and ys[i] are the coordinates of the i-th point",
+    )
+    def add_points(
+        self,
+        xs: list[float],
+        ys: list[float],
+    ) -> str:
+        """Add several points to the list"""
+        added = self.points.add(xs, ys)
+        return f"{len(added)} point(s) added, {len(self.points)} points in total"
+
+    @kernel_function(
+        name="remove_points",
+        description="Remove the points with the given indices (indices as returned by get_points)",
+    )
+    def remove_points(
+        self,
+        indices: list[int],
+    ) -> str:
+        """Remove several points from the list"""
+        removed = self.points.remove(indices)
+        if removed:
+            # le graphique ne sait pas retirer de lignes: il est redessiné
+            self.redraw()
+        return f"{removed} point(s) removed, {len(self.points)} points in total (indices have shifted)"
+
+    # requêtes géométriques sur l'index spatial (grille) du PointStore: réponses compactes, sans lister tous les points
+    @kernel_function(
+        name="nearest_points",
+        description="Finds the k points closest to (x, y), nearest first, with their index, coordinates and distance",
+    )
+    def nearest_points(
+        self,
+        x: float,
+        y: float,
+        k: Annotated[int, "number of neighbours"] = 1,
+    ) -> str:
+        """Finds the k nearest points"""
+        indices, distances = self.points.index.nearest(x, y, max(1, min(k, MAX_POINTS_PER_PAGE)))
+        return json.dumps([dict(point, distance=float(d)) for point, d in zip(self.points.rows(indices), distances)])
+
+    @kernel_function(
+        name="points_within_radius",
+        description="Counts the points at most radius away from (x, y) and returns the nearest of them",
+    )
+    def points_within_radius(
+        self,
+        x: float,
+        y: float,
+        radius: float,
+        limit: Annotated[int, "maximum number of points returned"] = 20,
+    ) -> str:
+        """Finds the points inside a circle"""
+        indices, distances = self.points.index.within_radius(x, y, radius)
+        limit = max(0, min(limit, MAX_POINTS_PER_PAGE))
+        points = [dict(point, distance=float(d)) for point, d in zip(self.points.rows(indices[:limit]), distances)]
+        return json.dumps({"count": int(len(indices)), "points": points})
+
+    @kernel_function(
+        name="points_in_box",
+        description="Counts the points inside the box [x_min, x_max] x [y_min, y_max], with a summary and the first of them",
+    )
+    def points_in_box(
+        self,
+        x_min: float,
+        y_min: float,
+        x_max: float,
+        y_max: float,
+        limit: Annotated[int, "maximum number of points returned"] = 20,
+    ) -> str:
+        """Finds the points inside a box"""
+        indices = self.points.index.in_box(x_min, y_min, x_max, y_max)
+        limit = max(0, min(limit, MAX_POINTS_PER_PAGE))
+        return json.dumps(dict(self.points.summary(indices), points=self.points.rows(indices[:limit])))
 ################################################
 
 
 
 ################################################
 # Telemétrie
-from telemetry import set_up_logging, set_up_metrics, set_up_tracing
+from telemetry import set_up_logging, set_up_metrics, set_up_tracing, prompt_tokens, chart_payload_bytes, chart_render_time
 
 
 set_up_logging()
@@ -90,12 +242,16 @@ async def main():
         st.session_state.kernel = Kernel() # déclaration du kernel
         st.session_state.chat_completion=AzureChatCompletion(service_id="chat-completion") # déclaration du service LLM
         st.session_state.kernel.add_service(st.session_state.chat_completion) # ajout du service au kernel
-        st.session_state.points = PointsPlugin([{"x": 0., "y": 1.}, {"x": 50., "y": -3.}])  # Déclaration du plugin, sa mémoire en session
+        st.session_state.points = PointsPlugin(PointStore.from_points([{"x": 0., "y": 1.}, {"x": 50., "y": -3.}]))  # Déclaration du plugin, sa mémoire en session
         st.session_state.kernel.add_plugin(st.session_state.points, # ajout du pluggin au kernel
                                            plugin_name="points")
+        st.session_state.kernel.add_filter(FilterTypes.AUTO_FUNCTION_INVOCATION, # regroupement des mises à jour du graphique
+                                           st.session_state.points.auto_function_invocation_filter)
         st.session_state.history = ChatHistory() # Déclaration de l'historique de chat dans la session
+        st.session_state.prompt_tokens = [] # tokens envoyés au modèle à chaque tour
 
     
+    st.session_state.points.downsampler.budget = st.sidebar.number_input("Points affichés au maximum", min_value=100, value=5000, step=1000)
     st.session_state.points.scatter_plot()
     # Initialize chat history
     if "messages" not in st.session_state:
@@ -108,6 +264,12 @@ async def main():
     ################################################
 
 
+    # Budget de tokens de l'historique: les vieux résultats d'outils sont résumés, les derniers tours gardés tels quels
+    reducer = TokenBudgetReducer(token_budget=st.sidebar.number_input("Budget de tokens de l'historique", min_value=500, value=4000, step=500),
+                                 keep_recent_turns=st.sidebar.number_input("Tours conservés en entier", min_value=1, value=2))
+    if st.session_state.prompt_tokens:
+        st.sidebar.line_chart(pd.DataFrame(st.session_state.prompt_tokens, columns=["estimés", "facturés"]))
+
     execution_settings = AzureChatPromptExecutionSettings()
     # Ajout de la possibilité au llm de choisir la fonction à exécuter
     execution_settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
@@ -123,8 +285,11 @@ async def main():
         # Ajout du prompt utilisateur à l'historique
         # history.add_message({"role": "user", "content": prompt})
         st.session_state.history.add_user_message(prompt)
+        estimated_tokens = reducer.reduce(st.session_state.history)
 
         # génération de la réponse par le LLM
+        plugin = st.session_state.points
+        tool_calls, chart_updates = plugin.tool_calls, plugin.chart_updates
         result = await st.session_state.chat_completion.get_chat_message_content(
             chat_history=st.session_state.history,
             settings=execution_settings,
@@ -133,6 +298,18 @@ async def main():
 
         # ajout de la réponse du llm à l'historique
         st.session_state.history.add_message(result)
+        st.session_state.points.flush()
+
+        # tokens du prompt: estimation locale avant l'appel et valeur renvoyée par le service (dernier appel du tour)
+        usage = result.metadata.get("usage")
+        billed_tokens = getattr(usage, "prompt_tokens", None)
+        prompt_tokens.record(estimated_tokens, {"source": "estimated"})
+        if billed_tokens is not None:
+            prompt_tokens.record(billed_tokens, {"source": "billed"})
+        st.session_state.prompt_tokens.append((estimated_tokens, billed_tokens))
+        st.sidebar.caption(f"Dernier tour: ~{estimated_tokens} tokens estimés, {billed_tokens} facturés")
+        st.sidebar.caption(f"Dernier tour: {plugin.tool_calls - tool_calls} appel(s) d'outils, "
+                           f"{plugin.chart_updates - chart_updates} mise(s) à jour du graphique")
 
         ################################################
         # Affichage de la réponse du LLM
@@ -142,6 +319,11 @@ async def main():
         st.session_state.messages.append({"role": "assistant", "content": result.content})
         ################################################
 
+    # mesure du dernier rendu du graphique (nombre de lignes, taille, temps)
+    if render := st.session_state.points.last_render:
+        st.sidebar.caption(f"Graphique ({render['kind']}): {render['rows']} lignes envoyées pour {render['points']} points, "
+                           f"{render['bytes'] / 1024:.0f} Ko, {render['ms']:.1f} ms")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,7 +1,20 @@
+import argparse
 import asyncio
+import contextvars
+import csv
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
 from typing import ClassVar
 
+from opentelemetry import trace
 from pydantic import Field
 
 from semantic_kernel import Kernel
@@ -9,6 +22,7 @@ from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureText
 from semantic_kernel.contents import ChatHistory
 from semantic_kernel.functions import kernel_function
 from semantic_kernel.kernel_pydantic import KernelBaseModel
+from semantic_kernel.processes.kernel_process.kernel_process import KernelProcess
 from semantic_kernel.processes.kernel_process.kernel_process_step import KernelProcessStep
 from semantic_kernel.processes.kernel_process.kernel_process_step_context import KernelProcessStepContext
 from semantic_kernel.processes.kernel_process.kernel_process_step_state import KernelProcessStepState
@@ -22,12 +36,181 @@ from semantic_kernel.connectors.ai.open_ai.prompt_execution_settings.azure_chat_
 
 import streamlit as st
 
+from checkpoint_store import create_checkpoint_store
+from image_store import ImageStore, StoredImage, request_key
+from rate_limit import AsyncRateLimiter
+from services import get_registry
+
+# Tracing dans le fichier telemetry : App Insights, et copie locale des spans si PROCESS_SPAN_FILE est défini
+# (analyse hors ligne: python process_report.py spans.jsonl)
+from telemetry import set_up_metrics, set_up_tracing, process_setup_time, process_step_duration
+
+set_up_tracing(span_file=os.getenv("PROCESS_SPAN_FILE"))
+set_up_metrics()
+tracer = trace.get_tracer("article-process")
+
 
 SERVICE_LINKEDIN_GENERATOR = "linkedin-content-generator"
 SERVICE_DALLE="dalle"
 
+# structure des branches du process:
+# - sequential: sujet -> post -> prompt de l'image -> image
+# - parallel: le prompt de l'image est dérivé du sujet puis l'image générée, dans un même step exécuté
+#   en même temps que la rédaction du post (durée ~ max(post, prompt + image)); l'article attend
+#   les deux résultats (post et image) avant d'être affiché
+BRANCHES_SEQUENTIAL = "sequential"
+BRANCHES_PARALLEL = "parallel"
+
+# limiteur de débit partagé par toutes les instances du process (mode batch)
+rate_limiter: AsyncRateLimiter | None = None
+
+
+async def call_service(call):
+    """Runs a service call (coroutine factory) on the registry loop, through the shared rate limiter when there is one."""
+    # les services sont liés à la boucle du registre (clients HTTP partagés entre reruns et sessions)
+    registry = get_registry()
+    if rate_limiter is None:
+        return await registry.call(call())
+    return await rate_limiter.run(lambda: registry.call(call()))
+
+
+async def stream_service(step: str, chat_service: AzureChatCompletion, chat_history: ChatHistory,
+                         settings: AzureChatPromptExecutionSettings, placeholder) -> str:
+    """Streams a chat completion into placeholder as the tokens arrive and returns the full text."""
+    async def consume():
+        stream = chat_service.get_streaming_chat_message_content(chat_history=chat_history, settings=settings)
+        text = await get_registry().stream_text(stream, placeholder.markdown, {"service": settings.service_id, "step": step})
+        if not text:
+            raise ValueError("Failed to get a response from the chat completion service.")
+        return text
+
+    if rate_limiter is None:
+        return await consume()
+    return await rate_limiter.run(consume)
+
+
+################################################
+# Points de reprise par exécution: état de l'article (clé: sujet) et sorties des étapes (clé: étape + entrée),
+# en mémoire ou dans un fichier SQLite (PROCESS_CHECKPOINT_DB), expirés après PROCESS_CHECKPOINT_TTL secondes.
+# L'exécution est identifiée par ?run=... dans l'URL (interface, stable après un redémarrage du serveur)
+# ou par le sujet (mode batch); les sorties des étapes sont effacées quand l'article est terminé
+PENDING_TOPIC_KEY = "pending_topic"
+CHECKPOINT_TTL = float(os.getenv("PROCESS_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+
+# identifiant de l'exécution courante, hérité par les tâches des étapes du process
+checkpoint_run: contextvars.ContextVar[str] = contextvars.ContextVar("checkpoint_run", default="batch")
+
+
+@st.cache_resource
+def get_checkpoint_store():
+    return create_checkpoint_store(os.getenv("PROCESS_CHECKPOINT_DB"), max_age=CHECKPOINT_TTL)
+
+
+def checkpoint_namespace() -> str:
+    return f"article:{checkpoint_run.get()}"
+
+
+def interactive_run_id() -> str:
+    """Id of the interactive run, kept in the URL so that a reload or a restarted server resumes it."""
+    if "run" not in st.query_params:
+        st.query_params["run"] = uuid.uuid4().hex[:12]
+    return st.query_params["run"]
+
+
+def batch_run_id(topic: str) -> str:
+    return "batch:" + hashlib.sha256(topic.encode("utf-8")).hexdigest()[:16]
+
+
+def drop_pending_topic(namespace: str) -> str | None:
+    """Forgets the topic to resume, returns it."""
+    store = get_checkpoint_store()
+    if (topic := store.get(namespace, PENDING_TOPIC_KEY)) is not None:
+        store.delete(namespace, PENDING_TOPIC_KEY)
+    return topic
+
+
+def article_key(topic: str) -> str:
+    return "article|" + topic
+
+
+async def checkpointed(step: str, step_input: str, generate) -> str:
+    """Output of step for this input: read from the checkpoints, else generated and saved."""
+    store, namespace = get_checkpoint_store(), checkpoint_namespace()
+    key = f"step|{step}|" + hashlib.sha256(step_input.encode("utf-8")).hexdigest()
+    if (output := store.get(namespace, key)) is not None:
+        print(f"{step}: sortie reprise du point de reprise")
+        return output
+    output = await generate()
+    store.put(namespace, key, output)
+    return output
+################################################
+
+
+################################################
+# Images téléchargées une seule fois, en arrière-plan dès leur génération: original (PNG) et version web (JPEG)
+# dans un cache local indexé par le prompt; l'affichage ne dépend plus des URL DALL-E (lentes, qui expirent)
+IMG_SIZE = 1024
+
+download_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="image-download")
+_downloads: dict[str, Future] = {}
+_downloads_lock = threading.Lock()
+
+
+@st.cache_resource
+def get_image_store() -> ImageStore:
+    return ImageStore(root=os.path.join(".image_store", "articles"), thumbnail_size=(768, 768))
+
+
+def start_download(prompt: str, url: str) -> Future:
+    """Starts the download of the image generated for prompt, unless it is already stored or downloading."""
+    store, key = get_image_store(), request_key(prompt, IMG_SIZE, IMG_SIZE)
+    with _downloads_lock:
+        if url not in _downloads:
+            _downloads[url] = download_executor.submit(lambda: store.get(key) or store.put_url(key, url))
+        return _downloads[url]
+
+
+async def downloaded_image(url: str) -> StoredImage | None:
+    """Waits for the download started for url; None if there is none or if it failed."""
+    with _downloads_lock:
+        future = _downloads.pop(url, None)
+    if future is None:
+        return None
+    try:
+        return await asyncio.wrap_future(future)
+    except Exception as exc:
+        print(f"Image download failed, the remote URL is kept: {exc}", file=sys.stderr)
+        return None
+################################################
+
+
+################################################
+# Traces: un span par exécution d'une fonction d'étape (attributs process.step / process.function)
+# et un span par événement émis (process.event), enfants du span "article_process" de l'exécution
+def traced_step(function):
+    """Runs a step function in a span and records its duration; the signature is kept for kernel_function."""
+    @functools.wraps(function)
+    async def wrapper(self, *args, **kwargs):
+        step, name = type(self).__name__, function.__name__
+        started = time.perf_counter()
+        with tracer.start_as_current_span(f"{step}.{name}",
+                                          attributes={"process.step": step, "process.function": name}):
+            try:
+                return await function(self, *args, **kwargs)
+            finally:
+                process_step_duration.record(time.perf_counter() - started, {"step": step, "function": name})
+    return wrapper
+
+
+async def emit(context: KernelProcessStepContext, event: "EventsIDs", data=None):
+    with tracer.start_as_current_span(f"emit {event.value}", attributes={"process.event": event.value}):
+        await context.emit_event(process_event=event, data=data)
+################################################
+
+
 class IntroStep(KernelProcessStep):
     @kernel_function
+    @traced_step
     async def print_intro_message(self):
         print("Welcome to Processes in Semantic Kernel.\n")
 
@@ -46,6 +229,7 @@ class UserInputStep(KernelProcessStep):
     GET_USER_TOPIC: ClassVar[str] = "get_user_topic"
 
     @kernel_function(name=GET_USER_TOPIC)
+    @traced_step
     async def get_user_topic(self, context: KernelProcessStepContext):
         """Gets the user input."""
         # topic = input("TOPIC: ")
@@ -53,7 +237,11 @@ class UserInputStep(KernelProcessStep):
         topic = None
         if topic := st.chat_input("Le sujet de votre article..."):
             st.chat_message("user", avatar='🤓').markdown(topic)
-            await context.emit_event(process_event=EventsIDs.UserTopicReceived, data=topic)
+            await emit(context, EventsIDs.UserTopicReceived, topic)
+        elif topic := get_checkpoint_store().get(checkpoint_namespace(), PENDING_TOPIC_KEY):
+            # génération interrompue par un rerun: reprise, les étapes déjà faites ne rappellent pas les modèles
+            st.chat_message("user", avatar='🤓').markdown(topic)
+            await emit(context, EventsIDs.UserTopicReceived, topic)
 
 
 class ArticleState(KernelBaseModel):
@@ -61,6 +249,13 @@ class ArticleState(KernelBaseModel):
     topic: str = ""
     linkedin_post_text: str = ""
     linkedin_img_url: str = ""
+    linkedin_img_path: str = ""
+    linkedin_img_web_path: str = ""
+
+
+def render_article(article: ArticleState):
+    st.image(article.linkedin_img_web_path or article.linkedin_img_url)
+    st.chat_message("assistant", avatar=r"assets\cadre.jpg").markdown(article.linkedin_post_text)
 
 
 class ArticleGenerator(KernelProcessStep[ArticleState]):
@@ -77,34 +272,63 @@ class ArticleGenerator(KernelProcessStep[ArticleState]):
         self.state.topic = self.state.topic or ""
         self.state.linkedin_post_text = self.state.linkedin_post_text or ""
         self.state.linkedin_img_url = self.state.linkedin_img_url or ""
+        self.state.linkedin_img_path = self.state.linkedin_img_path or ""
+        self.state.linkedin_img_web_path = self.state.linkedin_img_web_path or ""
+
+    def save(self):
+        get_checkpoint_store().put(checkpoint_namespace(), article_key(self.state.topic), self.state.model_dump_json())
 
     @kernel_function(name=SET_TOPIC)
+    @traced_step
     async def set_topic(self, context: "KernelProcessStepContext", topic: str, kernel: "Kernel"):
         self.state.topic = topic
         print(f"Topic received: {topic}")
+        trace.get_current_span().set_attribute("process.topic", topic)
+        get_checkpoint_store().put(checkpoint_namespace(), PENDING_TOPIC_KEY, topic)
+        self.save()
 
-        await context.emit_event(process_event=EventsIDs.Topic_set, data=topic)
+        await emit(context, EventsIDs.Topic_set, topic)
 
     @kernel_function(name=SET_POST)
+    @traced_step
     async def set_post(self, context: "KernelProcessStepContext", post: str, kernel: "Kernel"):
         self.state.linkedin_post_text = post
         print(f"Post received: {post}")
+        self.save()
 
-        await context.emit_event(process_event=EventsIDs.Post_set, data=post)
+        await emit(context, EventsIDs.Post_set, post)
+        await self.complete_if_ready(context)
 
     @kernel_function(name=SET_IMG)
+    @traced_step
     async def set_img(self, context: "KernelProcessStepContext", img_url: str, kernel: "Kernel"):
         self.state.linkedin_img_url = img_url
+        if stored := await downloaded_image(img_url):
+            self.state.linkedin_img_path = stored.path
+            self.state.linkedin_img_web_path = stored.thumbnail_path
+        self.save()
 
         print("Img set")
+        await self.complete_if_ready(context)
+
+    async def complete_if_ready(self, context: "KernelProcessStepContext"):
+        # jonction des branches: l'article est affiché quand le post et l'image sont arrivés (dans n'importe quel ordre)
+        if not (self.state.linkedin_post_text and self.state.linkedin_img_url):
+            return
         print("ARTICLE GENERATED:\n" + 
               f"{self.state.linkedin_img_url}\n" +
               f"{self.state.linkedin_post_text}")
 
         
-        st.image(self.state.linkedin_img_url)
-        st.chat_message("assistant", avatar=r"assets\cadre.jpg").markdown(self.state.linkedin_post_text)
-        await context.emit_event(process_event=EventsIDs.Exit)
+        render_article(self.state)
+        store, namespace = get_checkpoint_store(), checkpoint_namespace()
+        if store.get(namespace, PENDING_TOPIC_KEY) == self.state.topic:
+            store.delete(namespace, PENDING_TOPIC_KEY)
+        # article terminé: les sorties des étapes ne servent plus (l'article reste pour le réaffichage)
+        for key in store.keys(namespace):
+            if key.startswith("step|"):
+                store.delete(namespace, key)
+        await emit(context, EventsIDs.Exit)
 
     # @kernel_function(name=DISPLAY_POST)
     # async def display_post(self, context: "KernelProcessStepContext", kernel: "Kernel"):
@@ -121,6 +345,7 @@ class LinkedinGenerator(KernelProcessStep):
     # GENERATE_DALLE_PROMPT: ClassVar[str] = "generate_dalle_prompt"
 
     @kernel_function(name=GENERATE_LINKEDIN_TEXT)
+    @traced_step
     async def generate_linkedin_text_post(self, context: "KernelProcessStepContext", topic: str, kernel: "Kernel"):
         """Generates a linkedin post based on the prompt."""
         # Get chat completion service and generate a response
@@ -132,80 +357,112 @@ class LinkedinGenerator(KernelProcessStep):
                                         " A chaque fois que l'utilisateur donne un sujet, génère un post linkedin inspirant sur le sujet." + \
                                         " Surtout, fais en des caisses sur le côté professionnel et utilise des mots clés très corporate.")
         chat_history.add_user_message(topic)
-        response = await chat_service.get_chat_message_contents(chat_history=chat_history, settings=settings)
-
-        if response is None:
-            raise ValueError("Failed to get a response from the chat completion service.")
 
-        answer = response[0].content
+        # le post s'affiche au fil des tokens, l'événement final porte le texte complet
+        placeholder = st.chat_message("assistant", avatar=r"assets\linkedin.png").empty()
+        answer = await checkpointed(self.GENERATE_LINKEDIN_TEXT, topic,
+                                    lambda: stream_service(self.GENERATE_LINKEDIN_TEXT, chat_service, chat_history, settings, placeholder))
 
         print(f"{SERVICE_LINKEDIN_GENERATOR}: {answer}")
-        st.chat_message("assistant", avatar=r"assets\linkedin.png").markdown(answer)
+        placeholder.markdown(answer)
 
         # Emit an event: assistantResponse
-        await context.emit_event(process_event=EventsIDs.PostGenerated, data=answer)
+        await emit(context, EventsIDs.PostGenerated, answer)
+
+async def generate_image(kernel: "Kernel", prompt: str) -> str:
+    """Generates the image of the prompt with dall-e-3, starts its download and returns its url."""
+    dalle_service: AzureTextToImage = kernel.get_service(service_id=SERVICE_DALLE)
+
+    img_link = await checkpointed(ImgGenerator.GENERATE_DALLE_IMG, prompt,
+                                  lambda: call_service(lambda: dalle_service.generate_image(prompt, IMG_SIZE, IMG_SIZE)))
+
+    start_download(prompt, img_link)
+    print(f"DALLE GENERATED IMAGE: {img_link}")
+    st.chat_message("assistant", avatar=r"assets\dalle.jpg").markdown(img_link)
+    return img_link
+
 
 class DalleePromptGenerator(KernelProcessStep):
     GENERATE_DALLE_PROMPT: ClassVar[str] = "generate_dalle_prompt"
+    GENERATE_DALLE_IMG_FROM_TOPIC: ClassVar[str] = "generate_dalle_img_from_topic"
 
     @kernel_function(name=GENERATE_DALLE_PROMPT)
+    @traced_step
     async def generate_dalle_prompt(self, context: "KernelProcessStepContext", post: str, kernel: "Kernel"):
         """Generates a prompt for the image of linkedin post."""
+        print("Entree generate_dalle_prompt")
+        dalle_prompt = await self._generate(kernel,
+                                            "Génère moi un prompt pour générer une image avec dall-e-3 qui colle le mieux au POST LINKEDIN. Répond uniquement le prompt.\n\n" +
+                                            "POST LINKEDIN:\n" + post)
+        # Emit an event: assistantResponse
+        await emit(context, EventsIDs.ImgPromptGenerated, dalle_prompt)
+
+    @kernel_function(name=GENERATE_DALLE_IMG_FROM_TOPIC)
+    @traced_step
+    async def generate_dalle_img_from_topic(self, context: "KernelProcessStepContext", topic: str, kernel: "Kernel"):
+        """Generates the prompt then the image of a linkedin post on the topic (without waiting for the post)."""
+        print("Entree generate_dalle_img_from_topic")
+        # prompt et image enchaînés dans le même step: un événement n'est livré qu'au superstep suivant,
+        # un step image séparé attendrait la fin du post au lieu de se dérouler pendant sa rédaction
+        dalle_prompt = await self._generate(kernel,
+                                            "Génère moi un prompt pour générer une image avec dall-e-3 qui illustre le mieux un POST LINKEDIN corporate sur le SUJET. Répond uniquement le prompt.\n\n" +
+                                            "SUJET:\n" + topic)
+        await emit(context, EventsIDs.ImageGenerated, await generate_image(kernel, dalle_prompt))
+
+    async def _generate(self, kernel: "Kernel", request: str) -> str:
         # Add user message to the state
         # Get chat completion service and generate a response
-        print("Entree generate_dalle_prompt")
         chat_service: AzureChatCompletion = kernel.get_service(service_id=SERVICE_LINKEDIN_GENERATOR)
         settings = AzureChatPromptExecutionSettings(service_id=SERVICE_LINKEDIN_GENERATOR)
 
         chat_history = ChatHistory()
-        chat_history.add_user_message("Génère moi un prompt pour générer une image avec dall-e-3 qui colle le mieux au POST LINKEDIN. Répond uniquement le prompt.\n\n" +
-                                      "POST LINKEDIN:\n" + post)
-        response = await chat_service.get_chat_message_contents(chat_history=chat_history, settings=settings)
+        chat_history.add_user_message(request)
 
-        if response is None:
-            raise ValueError("Failed to get a response from the chat completion service.")
-
-        dalle_prompt = response[0].content
+        placeholder = st.chat_message("assistant", avatar=r"assets\prompt.jpg").empty()
+        dalle_prompt = await checkpointed(self.GENERATE_DALLE_PROMPT, request,
+                                          lambda: stream_service(self.GENERATE_DALLE_PROMPT, chat_service, chat_history, settings, placeholder))
 
         print(f"DALLE PROMPT GENERATOR: {dalle_prompt}")
 
-        st.chat_message("assistant", avatar=r"assets\prompt.jpg").markdown(dalle_prompt)
-        # Emit an event: assistantResponse
-        await context.emit_event(process_event=EventsIDs.ImgPromptGenerated, data=dalle_prompt)
+        placeholder.markdown(dalle_prompt)
+        return dalle_prompt
 
     
 class ImgGenerator(KernelProcessStep):
     GENERATE_DALLE_IMG: ClassVar[str] = "generate_dalle_img"
 
     @kernel_function(name=GENERATE_DALLE_IMG)
+    @traced_step
     async def generate_dalle_img(self, context: "KernelProcessStepContext", prompt: str, kernel: "Kernel"):
         """Generates an based on the prompt."""
-        # Add user message to the state
-        # Get chat completion service and generate a response
-        dalle_service: AzureTextToImage = kernel.get_service(service_id=SERVICE_DALLE)
-
-        img_link = await dalle_service.generate_image(prompt, 1024, 1024)
-
-        print(f"DALLE GENERATED IMAGE: {img_link}")
-        st.chat_message("assistant", avatar=r"assets\dalle.jpg").markdown(img_link)
+        img_link = await generate_image(kernel, prompt)
 
         # Emit an event: assistantResponse
-        await context.emit_event(process_event=EventsIDs.ImageGenerated, data=img_link)
-
-kernel = Kernel()
-
-
-async def step01_processes(scripted: bool = True):
-    st.title("Semantic Kernel - Processes")
-
-
-    kernel.add_service(AzureChatCompletion(service_id=SERVICE_LINKEDIN_GENERATOR, instruction_role="Tu es un super assistant qui aide l'utilisateur."))
-    kernel.add_service(
-        AzureTextToImage(service_id=SERVICE_DALLE,
-                                        deployment_name="dall-e-3",
-                                        api_version="2024-05-01-preview")
-    )
-
+        await emit(context, EventsIDs.ImageGenerated, img_link)
+
+@st.cache_resource
+def get_kernel() -> Kernel:
+    """Kernel and its services, built once per server process and shared by all sessions."""
+    started = time.perf_counter()
+    registry = get_registry()
+    kernel = Kernel()
+    kernel.add_service(registry.get_service(
+        SERVICE_LINKEDIN_GENERATOR,
+        lambda: AzureChatCompletion(service_id=SERVICE_LINKEDIN_GENERATOR, instruction_role="Tu es un super assistant qui aide l'utilisateur.",
+                                    async_client=registry.azure_openai_client()),
+    ))
+    kernel.add_service(registry.get_service(
+        SERVICE_DALLE,
+        lambda: AzureTextToImage(service_id=SERVICE_DALLE,
+                                 deployment_name="dall-e-3",
+                                 async_client=registry.azure_openai_client("2024-05-01-preview")),
+    ))
+    print(f"Kernel construit en {1000 * (time.perf_counter() - started):.1f} ms")
+    return kernel
+
+
+def build_process(branches: str = BRANCHES_SEQUENTIAL, interactive: bool = True):
+    """Builds the article process; without interactive the topic is the input event of the process."""
     process = ProcessBuilder(name="ChatBot")
 
     # Define the steps on the process builder based on their types, not concrete objects
@@ -219,6 +476,10 @@ async def step01_processes(scripted: bool = True):
 
     # Define the input event that starts the process and where to send it
     process.on_input_event(event_id=EventsIDs.StartProcess).send_event_to(target=intro_step)
+    if not interactive:
+        process.on_input_event(event_id=EventsIDs.UserTopicReceived).send_event_to(
+            target=article_step, parameter_name="topic", function_name=ArticleGenerator.SET_TOPIC,
+        )
 
     # Define the event that triggers the next step in the process
     intro_step.on_function_result(function_name=IntroStep.print_intro_message.__name__).send_event_to(
@@ -238,9 +499,18 @@ async def step01_processes(scripted: bool = True):
         target=article_step, parameter_name="post", function_name=ArticleGenerator.SET_POST
     )
 
-    article_step.on_event(event_id=EventsIDs.Post_set).send_event_to(
-        target=dalle_prompt_step, parameter_name="post", function_name=DalleePromptGenerator.GENERATE_DALLE_PROMPT
-    )
+    if branches == BRANCHES_PARALLEL:
+        # seconde branche partant du sujet (prompt puis image en un step), exécutée en même temps que la rédaction du post
+        article_step.on_event(event_id=EventsIDs.Topic_set).send_event_to(
+            target=dalle_prompt_step, parameter_name="topic", function_name=DalleePromptGenerator.GENERATE_DALLE_IMG_FROM_TOPIC
+        )
+        dalle_prompt_step.on_event(event_id=EventsIDs.ImageGenerated).send_event_to(
+            target=article_step, parameter_name="img_url", function_name=ArticleGenerator.SET_IMG
+        )
+    else:
+        article_step.on_event(event_id=EventsIDs.Post_set).send_event_to(
+            target=dalle_prompt_step, parameter_name="post", function_name=DalleePromptGenerator.GENERATE_DALLE_PROMPT
+        )
 
     dalle_prompt_step.on_event(event_id=EventsIDs.ImgPromptGenerated).send_event_to(
         target=dalle_generation_step, parameter_name="prompt", function_name=ImgGenerator.GENERATE_DALLE_IMG
@@ -253,16 +523,202 @@ async def step01_processes(scripted: bool = True):
     article_step.on_event(event_id=EventsIDs.Exit).stop_process()
 
     # Build the kernel process
-    kernel_process = process.build()
+    return process.build()
+
+
+@st.cache_resource
+def get_process(branches: str = BRANCHES_SEQUENTIAL, interactive: bool = True) -> KernelProcess:
+    """Compiled process graph, built once per server process for each shape."""
+    started = time.perf_counter()
+    kernel_process = build_process(branches, interactive)
+    print(f"Process {branches} construit en {1000 * (time.perf_counter() - started):.1f} ms")
+    return kernel_process
+
+
+def new_process(branches: str = BRANCHES_SEQUENTIAL, interactive: bool = True) -> KernelProcess:
+    # copie par exécution: l'état des étapes n'est jamais partagé entre sessions ou sujets
+    return get_process(branches, interactive).model_copy(deep=True)
+
+
+async def step01_processes(scripted: bool = True):
+    st.title("Semantic Kernel - Processes")
+    branches = st.sidebar.radio("Branches du process", [BRANCHES_SEQUENTIAL, BRANCHES_PARALLEL], index=0)
+
+    # articles déjà terminés dans cette exécution, réaffichés depuis les points de reprise (sans appel aux modèles)
+    checkpoint_run.set(interactive_run_id())
+    store, namespace = get_checkpoint_store(), checkpoint_namespace()
+    for key in store.keys(namespace):
+        if key.startswith("article|"):
+            article = ArticleState.model_validate_json(store.get(namespace, key))
+            if article.linkedin_post_text and article.linkedin_img_url and article.topic != store.get(namespace, PENDING_TOPIC_KEY):
+                st.chat_message("user", avatar='🤓').markdown(article.topic)
+                render_article(article)
+
+
+    # coût de préparation d'un rerun: construction au premier passage, lecture du cache ensuite
+    setup_started = time.perf_counter()
+    kernel = get_kernel()
+    kernel_process = new_process(branches)
+    setup_time = time.perf_counter() - setup_started
+    process_setup_time.record(setup_time, {"mode": "interactive"})
+    st.sidebar.caption(f"Préparation du kernel et du process: {1000 * setup_time:.1f} ms")
 
     # Start the process
-    await start(
-        process=kernel_process,
-        kernel=kernel,
-        initial_event=KernelProcessEvent(id=EventsIDs.StartProcess, data=None),
-    )
+    try:
+        with tracer.start_as_current_span("article_process", attributes={"process.branches": branches}):
+            await start(
+                process=kernel_process,
+                kernel=kernel,
+                initial_event=KernelProcessEvent(id=EventsIDs.StartProcess, data=None),
+            )
+    except Exception:
+        drop_pending_topic(namespace)
+        raise
+    # un rerun interrompt le script (le sujet reste à reprendre); arrivé ici, le run s'est terminé sans Exit:
+    # une étape a échoué, le sujet n'est pas relancé automatiquement à chaque rerun
+    if topic := drop_pending_topic(namespace):
+        st.warning(f"La génération de l'article sur « {topic} » n'a pas abouti, renvoyez le sujet pour réessayer.")
+
+
+################################################
+# Mode batch (sans interface): un process par sujet, plusieurs en parallèle
+# python 03-processes.py --batch topics.jsonl --output articles.jsonl --workers 4 --rpm 30
+def read_topics(path: str) -> list[str]:
+    """Topics from a JSONL file ({"topic": ...} or a string per line) or a CSV file (column "topic", else the first one)."""
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            rows = list(csv.reader(file))
+            if not rows:
+                return []
+            column = rows[0].index("topic") if "topic" in rows[0] else 0
+            rows = rows[1:] if "topic" in rows[0] else rows
+            return [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+        topics = []
+        for line in file:
+            if line.strip():
+                value = json.loads(line)
+                topics.append(value["topic"] if isinstance(value, dict) else str(value))
+        return topics
+
+
+def read_done_topics(path: str) -> set[str]:
+    # reprise après un redémarrage: les sujets déjà présents dans le fichier de sortie sont sautés
+    if not os.path.exists(path):
+        return set()
+    done, broken = set(), None
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            if broken is not None:
+                raise ValueError(f"{path}:{broken}: invalid JSON line before the end of the file")
+            try:
+                record = json.loads(line)
+                topic = record["topic"]
+            except (json.JSONDecodeError, KeyError):
+                # dernière ligne tronquée par un arrêt brutal: le sujet sera refait
+                broken = number
+                continue
+            # article incomplet (écrit par une version antérieure): le sujet sera refait
+            if record.get("post") and record.get("image"):
+                done.add(topic)
+    return done
+
+
+def trim_partial_line(path: str):
+    """Cuts an unterminated last line (write interrupted by a kill) so that the next records start on their own line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as file:
+        data = file.read()
+        if data and not data.endswith(b"\n"):
+            file.truncate(data.rfind(b"\n") + 1)
+
+
+async def generate_article(topic: str, branches: str) -> ArticleState:
+    kernel = get_kernel()
+    kernel_process = new_process(branches, interactive=False)
+    # points de reprise propres au sujet (les workers s'exécutent en parallèle), supprimés une fois l'article écrit
+    # (un batch interrompu reprend les étapes déjà faites avec PROCESS_CHECKPOINT_DB)
+    run = checkpoint_run.set(batch_run_id(topic))
+    try:
+        with tracer.start_as_current_span("article_process", attributes={"process.branches": branches, "process.topic": topic}):
+            async with await start(
+                process=kernel_process,
+                kernel=kernel,
+                initial_event=KernelProcessEvent(id=EventsIDs.UserTopicReceived, data=topic),
+            ) as process_context:
+                process_state = await process_context.get_state()
+    finally:
+        checkpoint_run.reset(run)
+    article_state = next(step.state.state for step in process_state.steps if step.state.name == ArticleGenerator.__name__)
+    article = ArticleState.model_validate(article_state)
+    # le runtime local avale les exceptions des steps (événement OnError): un article incomplet est un échec
+    if not article.linkedin_post_text or not article.linkedin_img_url:
+        missing = [name for name, value in (("post", article.linkedin_post_text), ("image", article.linkedin_img_url)) if not value]
+        raise RuntimeError(f"process ended without {' and '.join(missing)}")
+    return article
+
+
+async def run_batch(input_path: str, output_path: str, workers: int, requests_per_minute: float | None, branches: str):
+    global rate_limiter
+    rate_limiter = AsyncRateLimiter(max_concurrency=workers, requests_per_minute=requests_per_minute)
+
+    setup_started = time.perf_counter()
+    get_kernel()
+    get_process(branches, interactive=False)
+    process_setup_time.record(time.perf_counter() - setup_started, {"mode": "batch"})
+
+    done = read_done_topics(output_path)
+    todo = [topic for topic in dict.fromkeys(read_topics(input_path)) if topic not in done]
+    print(f"{len(todo)} sujet(s) à traiter, {len(done)} déjà faits")
+
+    queue = asyncio.Queue()
+    for topic in todo:
+        queue.put_nowait(topic)
+    counts = {"ok": 0, "failed": 0}
+    started = time.perf_counter()
+
+    trim_partial_line(output_path)
+    with open(output_path, "a", encoding="utf-8") as output:
+        async def worker():
+            while not queue.empty():
+                topic = queue.get_nowait()
+                topic_started = time.perf_counter()
+                try:
+                    article = await generate_article(topic, branches)
+                except Exception as exc:
+                    counts["failed"] += 1
+                    print(f"[{counts['ok'] + counts['failed']}/{len(todo)}] ÉCHEC {topic!r}: {exc}", file=sys.stderr)
+                    continue
+                record = {"topic": topic, "post": article.linkedin_post_text, "image": article.linkedin_img_url,
+                          "image_path": article.linkedin_img_path,
+                          "seconds": round(time.perf_counter() - topic_started, 2)}
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                get_checkpoint_store().delete("article:" + batch_run_id(topic))
+                counts["ok"] += 1
+                print(f"[{counts['ok'] + counts['failed']}/{len(todo)}] {topic!r} ({record['seconds']} s)")
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+
+    elapsed = time.perf_counter() - started
+    print(f"{counts['ok']} article(s) générés, {counts['failed']} échec(s) en {elapsed:.1f} s "
+          f"({60 * counts['ok'] / elapsed if elapsed else 0:.1f} articles/min, {rate_limiter.throttled} pause(s) sur 429)")
+################################################
 
 
 if __name__ == "__main__":
-    # if you want to run this sample with your won input, set the below parameter to False
-    asyncio.run(step01_processes(scripted=False))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Génération d'articles linkedin avec un process semantic kernel")
+    parser.add_argument("--batch", help="fichier de sujets (.jsonl ou .csv) à traiter sans interface")
+    parser.add_argument("--output", default="articles.jsonl", help="fichier JSONL des articles générés")
+    parser.add_argument("--workers", type=int, default=4, help="nombre de process exécutés en parallèle")
+    parser.add_argument("--rpm", type=float, default=None, help="nombre maximal d'appels aux modèles par minute")
+    parser.add_argument("--branches", choices=[BRANCHES_SEQUENTIAL, BRANCHES_PARALLEL], default=BRANCHES_SEQUENTIAL)
+    args, _ = parser.parse_known_args()
+
+    if args.batch:
+        asyncio.run(run_batch(args.batch, args.output, args.workers, args.rpm, args.branches))
+    else:
+        # if you want to run this sample with your won input, set the below parameter to False
+        asyncio.run(step01_processes(scripted=False))
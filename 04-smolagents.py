@@ -2,10 +2,12 @@
 # From https://huggingface.co/docs/smolagents/en/examples/text_to_sql
 ####################
 
+import argparse
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
+from opentelemetry import trace
 from phoenix.otel import register
 from openinference.instrumentation.smolagents import SmolagentsInstrumentor
 
@@ -20,13 +22,27 @@ from sqlalchemy import (
     String,
     Integer,
     Float,
-    insert,
-    inspect,
+    select,
     text,
 )
 
 from smolagents import tool, CodeAgent, AzureOpenAIServerModel
 
+from schema_catalog import SchemaCatalog
+from sql_loader import bulk_insert, load_file
+from sql_results import QueryCache, format_result, is_write
+
+# Chargement de gros volumes pour tester l'agent:
+# python 04-smolagents.py --db receipts.sqlite --load receipts=receipts.csv --load waiters=waiters.parquet
+parser = argparse.ArgumentParser(description="Agent text-to-SQL smolagents")
+parser.add_argument("--db", default=":memory:", help="fichier SQLite (en mémoire par défaut)")
+parser.add_argument("--load", action="append", default=[], metavar="TABLE=FICHIER",
+                    help="fichier CSV, JSONL ou Parquet à charger dans une table (répétable)")
+parser.add_argument("--chunk-size", type=int, default=50_000, help="nombre de lignes lues et insérées par lot")
+parser.add_argument("--allow-writes", action="store_true",
+                    help="autoriser les requêtes d'écriture (INSERT, UPDATE, DELETE, DDL) du tool sql_engine, refusées par défaut")
+args, _ = parser.parse_known_args()
+
 endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", None)  
 model_id = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT_NAME", None)  
 subscription_key = os.getenv("AZURE_OPENAI_API_KEY", None)  
@@ -39,14 +55,23 @@ model = AzureOpenAIServerModel(
     api_version=api_version
 )
 
-engine = create_engine("sqlite:///:memory:")
+engine = create_engine(f"sqlite:///{args.db}")
 metadata_obj = MetaData()
 
+# cache des résultats du tool sql_engine (l'agent relance souvent les mêmes requêtes), invalidé par table à l'écriture
+query_cache = QueryCache(max_entries=int(os.getenv("SQL_CACHE_MAX_ENTRIES", "256")),
+                         max_bytes=int(os.getenv("SQL_CACHE_MAX_BYTES", "4000000")))
+
 def insert_rows_into_table(rows, table, engine=engine):
-    for row in rows:
-        stmt = insert(table).values(**row)
-        with engine.begin() as connection:
-            connection.execute(stmt)
+    # une seule transaction et un executemany pour toutes les lignes
+    columns = [column.name for column in table.columns]
+    report = bulk_insert(engine, table, [[tuple(row.get(name) for name in columns) for row in rows]])
+    query_cache.invalidate(table.name)
+    return report
+
+def table_is_empty(table, engine=engine):
+    with engine.connect() as connection:
+        return connection.execute(select(table).limit(1)).first() is None
 
 table_name = "receipts"
 receipts = Table(
@@ -65,13 +90,9 @@ rows = [
     {"receipt_id": 3, "customer_name": "Woodrow Wilson", "price": 53.43, "tip": 5.43},
     {"receipt_id": 4, "customer_name": "Margaret James", "price": 21.11, "tip": 1.00},
 ]
-insert_rows_into_table(rows, receipts)
-
-inspector = inspect(engine)
-columns_info = [(col["name"], col["type"]) for col in inspector.get_columns("receipts")]
-
-table_description = "Columns:\n" + "\n".join([f"  - {name}: {col_type}" for name, col_type in columns_info])
-print(table_description)
+# lignes d'exemple ajoutées seulement à une table vide (base --db persistante déjà remplie)
+if table_is_empty(receipts):
+    insert_rows_into_table(rows, receipts)
 
 table_name = "waiters"
 waiters = Table(
@@ -88,7 +109,17 @@ rows = [
     {"receipt_id": 3, "waiter_name": "Michael Watts"},
     {"receipt_id": 4, "waiter_name": "Margaret James"},
 ]
-insert_rows_into_table(rows, waiters)
+if table_is_empty(waiters):
+    insert_rows_into_table(rows, waiters)
+
+for load in args.load:
+    table, path = load.split("=", 1)
+    print(load_file(engine, metadata_obj.tables[table], path, chunk_size=args.chunk_size))
+    query_cache.invalidate(table)
+
+# taille maximale du résultat renvoyé au modèle (les lignes au-delà sont comptées, pas écrites)
+SQL_MAX_ROWS = int(os.getenv("SQL_TOOL_MAX_ROWS", "50"))
+SQL_MAX_BYTES = int(os.getenv("SQL_TOOL_MAX_BYTES", "8000"))
 
 @tool
 def sql_engine(query: str) -> str:
@@ -104,36 +135,67 @@ def sql_engine(query: str) -> str:
     Args:
         query: The query to perform. This should be correct SQL.
     """
-    output = ""
-    with engine.connect() as con:
-        rows = con.execute(text(query))
-        for row in rows:
-            output += "\n" + str(row)
-
+    # tool en lecture seule par défaut: les écritures sont refusées avant exécution
+    # (pysqlite valide le DDL immédiatement, une annulation à la fermeture ne suffit pas)
+    if is_write(query) and not args.allow_writes:
+        return "Error: the database is read-only, INSERT / UPDATE / DELETE / REPLACE / CREATE / DROP / ALTER are refused."
+
+    cacheable = query_cache.cacheable(query)
+    output = query_cache.get(query) if cacheable else None
+    hit = output is not None
+    if not hit:
+        with engine.connect() as con:
+            if args.allow_writes:
+                changes = con.exec_driver_sql("SELECT total_changes()").scalar()
+                output = format_result(con.execute(text(query)), max_rows=SQL_MAX_ROWS, max_bytes=SQL_MAX_BYTES)
+                con.commit()
+                if is_write(query):
+                    query_cache.invalidate_for(query)
+                elif con.exec_driver_sql("SELECT total_changes()").scalar() != changes:
+                    # écriture non reconnue (WITH ... DELETE ...): tables inconnues, tout le cache est invalidé
+                    query_cache.invalidate()
+            else:
+                # garde-fou pour les écritures non reconnues: SQLite les refuse en mode query_only
+                con.exec_driver_sql("PRAGMA query_only = ON")
+                try:
+                    output = format_result(con.execute(text(query)), max_rows=SQL_MAX_ROWS, max_bytes=SQL_MAX_BYTES)
+                finally:
+                    con.exec_driver_sql("PRAGMA query_only = OFF")
+        if cacheable and (not args.allow_writes or not is_write(query)):
+            query_cache.put(query, output)
+
+    # taux de succès du cache visible sur le span du tool (phoenix)
+    span = trace.get_current_span()
+    span.set_attribute("sql.cache.hit", hit)
+    for name, value in query_cache.stats().items():
+        span.set_attribute(f"sql.cache.{name}", value)
     return output
 
-updated_description = """Allows you to perform SQL queries on the table. Beware that this tool's output is a string representation of the execution output.
+TOOL_DESCRIPTION = f"""Allows you to perform SQL queries on the table. Beware that this tool's output is a string representation of the execution output:
+a header row then one row per line, values separated by " | ", at most {SQL_MAX_ROWS} rows (a footer tells how many rows were left out),
+and a last line with the row count and the min/max of each column (over the scanned rows only when it says "min/max over the first N rows"). Prefer aggregates and LIMIT to reading whole tables.
 It can use the following tables:"""
 
-inspector = inspect(engine)
-for table in ["receipts", "waiters"]:
-    columns_info = [(col["name"], col["type"]) for col in inspector.get_columns(table)]
-
-    table_description = f"Table '{table}':\n"
-
-    table_description += "Columns:\n" + "\n".join([f"  - {name}: {col_type}" for name, col_type in columns_info])
-    updated_description += "\n\n" + table_description
+# schéma lu au premier usage et mis en cache (seules les tables modifiées sont relues);
+# la description du tool ne contient que les tables utiles à la question
+catalog = SchemaCatalog(engine)
+SCHEMA_MAX_TABLES = int(os.getenv("SQL_SCHEMA_MAX_TABLES", "5"))
 
-print(updated_description)
+def ask(question: str):
+    updated_description = TOOL_DESCRIPTION + "\n\n" + catalog.describe(catalog.relevant_tables(question, SCHEMA_MAX_TABLES))
+    print(updated_description)
 
-sql_engine.description = updated_description
+    sql_engine.description = updated_description
 
-agent = CodeAgent(tools=[sql_engine],
-                  model=model)
+    # agent créé après la mise à jour de la description, qui fait partie de son prompt système
+    agent = CodeAgent(tools=[sql_engine],
+                      model=model)
+    return agent.run(question)
 
-gen = agent.run("Can you give me the name of the client who got the most expensive receipt and the amount of receipt?")
+gen = ask("Can you give me the name of the client who got the most expensive receipt and the amount of receipt?")
+print(f"Cache SQL: {query_cache.stats()}")
 # gen = agent.run("Can you give me the name of the client who got the most expensive receipt and the amount of receipt?", stream=True)
 # for i in gen:
 #     print(i)
-#agent.run("Which waiter got more total money from tips?")
+#ask("Which waiter got more total money from tips?")
 
@@ -0,0 +1,108 @@
+import sqlite3
+import threading
+import time
+
+# intervalle minimal entre deux purges des points de reprise expirés (secondes)
+PURGE_INTERVAL = 60.0
+
+
+class MemoryCheckpointStore:
+    """Checkpoints kept in memory (to be stored in st.session_state or in a cached resource).
+
+    With max_age (seconds), entries not written for longer are ignored and purged.
+    """
+
+    def __init__(self, max_age: float | None = None):
+        self.max_age = max_age
+        self._data = {}  # (namespace, key) -> (value, written at)
+        self._last_purge = time.time()
+        self._lock = threading.Lock()
+
+    def _expired(self, written: float, now: float) -> bool:
+        return self.max_age is not None and now - written > self.max_age
+
+    def get(self, namespace: str, key: str) -> str | None:
+        with self._lock:
+            entry = self._data.get((namespace, key))
+        return entry[0] if entry and not self._expired(entry[1], time.time()) else None
+
+    def put(self, namespace: str, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._data[(namespace, key)] = (value, now)
+            if self.max_age is not None and now - self._last_purge > PURGE_INTERVAL:
+                for data_key in [k for k, (_, written) in self._data.items() if self._expired(written, now)]:
+                    del self._data[data_key]
+                self._last_purge = now
+
+    def delete(self, namespace: str, key: str | None = None):
+        with self._lock:
+            for data_key in [k for k in self._data if k[0] == namespace and (key is None or k[1] == key)]:
+                del self._data[data_key]
+
+    def keys(self, namespace: str) -> list[str]:
+        now = time.time()
+        with self._lock:
+            return [k[1] for k, (_, written) in self._data.items() if k[0] == namespace and not self._expired(written, now)]
+
+
+class SqliteCheckpointStore:
+    """Checkpoints kept in an SQLite file, they survive a restart of the server.
+
+    With max_age (seconds), entries not written for longer are ignored and purged.
+    """
+
+    def __init__(self, path: str, max_age: float | None = None):
+        self.max_age = max_age
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS checkpoints "
+                         "(namespace TEXT, key TEXT, value TEXT, updated REAL, PRIMARY KEY (namespace, key))")
+        if "updated" not in [row[1] for row in self._db.execute("PRAGMA table_info(checkpoints)")]:
+            # fichier d'une version sans date: ses entrées sont considérées comme expirées
+            self._db.execute("ALTER TABLE checkpoints ADD COLUMN updated REAL DEFAULT 0")
+        self._db.commit()
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._purge(time.time())
+
+    def _oldest(self, now: float) -> float:
+        return now - self.max_age if self.max_age is not None else float("-inf")
+
+    def _purge(self, now: float):
+        if self.max_age is None or now - self._last_purge <= PURGE_INTERVAL:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM checkpoints WHERE updated < ?", (self._oldest(now),))
+            self._db.commit()
+        self._last_purge = now
+
+    def get(self, namespace: str, key: str) -> str | None:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM checkpoints WHERE namespace = ? AND key = ? AND updated >= ?",
+                                   (namespace, key, self._oldest(time.time()))).fetchone()
+        return row[0] if row else None
+
+    def put(self, namespace: str, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)", (namespace, key, value, now))
+            self._db.commit()
+        self._purge(now)
+
+    def delete(self, namespace: str, key: str | None = None):
+        with self._lock:
+            if key is None:
+                self._db.execute("DELETE FROM checkpoints WHERE namespace = ?", (namespace,))
+            else:
+                self._db.execute("DELETE FROM checkpoints WHERE namespace = ? AND key = ?", (namespace, key))
+            self._db.commit()
+
+    def keys(self, namespace: str) -> list[str]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT key FROM checkpoints WHERE namespace = ? AND updated >= ?",
+                                                       (namespace, self._oldest(time.time())))]
+
+
+def create_checkpoint_store(path: str | None = None, max_age: float | None = None):
+    """SQLite store when a path is given, memory store otherwise; entries expire after max_age seconds if set."""
+    return SqliteCheckpointStore(path, max_age) if path else MemoryCheckpointStore(max_age)
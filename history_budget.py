@@ -0,0 +1,94 @@
+import json
+
+from semantic_kernel.contents import ChatHistory, FunctionCallContent, FunctionResultContent, TextContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except ImportError:  # tiktoken is optional, ~4 characters per token otherwise
+    _encoding = None
+
+SUMMARY_PREFIX = "[résumé]"
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message) -> int:
+    tokens = MESSAGE_OVERHEAD
+    for item in message.items:
+        if isinstance(item, TextContent):
+            tokens += count_tokens(item.text)
+        elif isinstance(item, FunctionCallContent):
+            arguments = item.arguments if isinstance(item.arguments, str) else json.dumps(item.arguments)
+            tokens += count_tokens(item.name or "") + count_tokens(arguments or "")
+        elif isinstance(item, FunctionResultContent):
+            tokens += count_tokens(str(item.result))
+    return tokens
+
+
+def history_tokens(history: ChatHistory) -> int:
+    return sum(message_tokens(message) for message in history.messages)
+
+
+class TokenBudgetReducer:
+    """Keeps a chat history under a token budget.
+
+    The last turns (a turn starts at a user message) are kept verbatim. In older
+    turns the tool results and the large tool call arguments are first collapsed
+    into short summaries; if that is not enough the oldest turns are dropped.
+    Tool calls and their results always stay paired.
+    """
+
+    def __init__(self, token_budget: int = 4000, keep_recent_turns: int = 2, summary_chars: int = 120):
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.summary_chars = summary_chars
+
+    def _summary(self, name: str, text: str) -> str:
+        return f"{SUMMARY_PREFIX} {name}: {text[:self.summary_chars]}... ({len(text)} caractères)"
+
+    def _collapse(self, message):
+        for i, item in enumerate(message.items):
+            if isinstance(item, FunctionResultContent):
+                result = str(item.result)
+                if len(result) > self.summary_chars and not result.startswith(SUMMARY_PREFIX):
+                    message.items[i] = item.model_copy(update={"result": self._summary(item.name or "", result)})
+            elif isinstance(item, FunctionCallContent):
+                arguments = item.arguments if isinstance(item.arguments, str) else json.dumps(item.arguments)
+                if arguments and len(arguments) > self.summary_chars and SUMMARY_PREFIX not in arguments:
+                    summary = json.dumps({"summary": self._summary(item.name or "", arguments)}, ensure_ascii=False)
+                    message.items[i] = item.model_copy(update={"arguments": summary})
+
+    def _turn_starts(self, history: ChatHistory) -> list[int]:
+        return [i for i, message in enumerate(history.messages) if message.role == AuthorRole.USER]
+
+    def reduce(self, history: ChatHistory) -> int:
+        """Reduces the history in place, returns its token count."""
+        if history_tokens(history) <= self.token_budget:
+            return history_tokens(history)
+
+        starts = self._turn_starts(history)
+        # tours récents gardés intacts; moins de tours que keep_recent_turns: aucun n'est ancien
+        if self.keep_recent_turns == 0:
+            stale_end = len(history.messages)
+        else:
+            stale_end = starts[-self.keep_recent_turns] if len(starts) >= self.keep_recent_turns else 0
+        for message in history.messages[:stale_end]:
+            self._collapse(message)
+
+        # suppression des tours les plus anciens (les messages système sont conservés)
+        while history_tokens(history) > self.token_budget:
+            starts = self._turn_starts(history)
+            if len(starts) <= self.keep_recent_turns or len(starts) < 2:
+                break
+            first, second = starts[0], starts[1]
+            history.messages[first:second] = [m for m in history.messages[first:second] if m.role == AuthorRole.SYSTEM]
+        return history_tokens(history)
@@ -0,0 +1,81 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import urllib.request
+from dataclasses import dataclass
+
+from PIL import Image
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    digest: str
+    path: str
+    thumbnail_path: str
+
+
+def request_key(prompt: str, width: int, height: int, variant: int = 0) -> str:
+    """Key of a generation request: same prompt (modulo case/spaces) and size give the same key."""
+    normalized = " ".join(prompt.split()).lower()
+    return hashlib.sha256(f"{normalized}|{width}x{height}|{variant}".encode("utf-8")).hexdigest()
+
+
+class ImageStore:
+    """Content-addressed image store on disk.
+
+    Images are saved once under the sha256 of their bytes, with a compressed JPEG
+    thumbnail next to them. An SQLite index maps generation requests to images so
+    that an identical request does not need a new call to the model.
+    """
+
+    def __init__(self, root: str = ".image_store", thumbnail_size: tuple[int, int] = (512, 512),
+                 thumbnail_quality: int = 80):
+        self.root = root
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS requests (key TEXT PRIMARY KEY, digest TEXT, source TEXT)")
+        self._db.commit()
+
+    def _paths(self, digest: str) -> tuple[str, str]:
+        return (os.path.join(self.root, "objects", digest[:2], digest + ".png"),
+                os.path.join(self.root, "thumbnails", digest[:2], digest + ".jpg"))
+
+    def get(self, key: str) -> StoredImage | None:
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM requests WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        path, thumbnail_path = self._paths(row[0])
+        if not (os.path.exists(path) and os.path.exists(thumbnail_path)):
+            return None
+        return StoredImage(row[0], path, thumbnail_path)
+
+    def put_bytes(self, key: str, data: bytes, source: str = "") -> StoredImage:
+        digest = hashlib.sha256(data).hexdigest()
+        path, thumbnail_path = self._paths(digest)
+        if not os.path.exists(path):
+            image = Image.open(io.BytesIO(data))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image.save(path + ".tmp", format="PNG")
+            os.replace(path + ".tmp", path)
+        if not os.path.exists(thumbnail_path):
+            image = Image.open(path).convert("RGB")
+            image.thumbnail(self.thumbnail_size)
+            os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+            image.save(thumbnail_path + ".tmp", format="JPEG", quality=self.thumbnail_quality, optimize=True)
+            os.replace(thumbnail_path + ".tmp", thumbnail_path)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO requests VALUES (?, ?, ?)", (key, digest, source))
+            self._db.commit()
+        return StoredImage(digest, path, thumbnail_path)
+
+    def put_url(self, key: str, url: str, timeout: float = 60.0) -> StoredImage:
+        """Downloads the image once (blocking, run it in a thread from async code)."""
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = response.read()
+        return self.put_bytes(key, data, source=url)
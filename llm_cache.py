@@ -0,0 +1,95 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_text(text: str) -> str:
+    # Casse et espaces ne changent pas la question posée
+    return " ".join((text or "").split()).lower()
+
+
+def make_cache_key(history, settings) -> str:
+    """Builds a stable key from the chat history and the generation settings."""
+    messages = [(str(message.role), normalize_text(message.content)) for message in history.messages]
+    params = {
+        "temperature": getattr(settings, "temperature", None),
+        "max_completion_tokens": getattr(settings, "max_completion_tokens", None),
+    }
+    payload = json.dumps({"messages": messages, "settings": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two tier cache (in-memory LRU + optional SQLite file) for LLM answers."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600.0, db_path: str | None = None,
+                 max_db_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (expires_at, content)
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, content TEXT, expires_at REAL, last_used REAL)")
+            self._db.commit()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, content = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return content
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT content, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, content: str):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, content)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                 (key, content, expires_at, now))
+                self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                # éviction par taille: on garde les entrées utilisées le plus récemment
+                self._db.execute("DELETE FROM responses WHERE key NOT IN "
+                                 "(SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)",
+                                 (self.max_db_entries,))
+                self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, content: str):
+        self._memory[key] = (expires_at, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "entries": len(self._memory)}
@@ -0,0 +1,281 @@
+import numpy as np
+import pandas as pd
+
+
+def _pack(i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    # deux indices de cellule (|indice| < 2**31) en une seule clé int64: np.unique 1D est bien plus rapide
+    return (i.astype(np.int64) << 32) + (j.astype(np.int64) & 0xFFFFFFFF)
+
+
+class GridIndex:
+    """Uniform grid over the points of a PointStore, for nearest neighbour and range queries.
+
+    Each occupied cell keeps the indices of its points. The grid is updated
+    incrementally when points are added and rebuilt (with a cell size adapted to
+    the density) when points are removed or when the cells get too crowded or too sparse.
+    """
+
+    MIN_MEAN_OCCUPANCY = 2
+    MAX_MEAN_OCCUPANCY = 64
+    TARGET_OCCUPANCY = 8
+    REBUILD_GROWTH = 2  # a crowded grid is rebuilt again only once the store has doubled
+
+    def __init__(self, store: "PointStore", cell_size: float = 1.0):
+        self.store = store
+        self.cell_size = cell_size
+        self.cells = {}
+        self._bounds = None  # (i_min, i_max, j_min, j_max) of the occupied cells
+        self._rebuilt_size = 0  # store size at the last rebuild
+
+    def _cell_of(self, x, y):
+        return (np.floor(np.asarray(x) / self.cell_size).astype(np.int64),
+                np.floor(np.asarray(y) / self.cell_size).astype(np.int64))
+
+    def insert(self, start: int, end: int, check_occupancy: bool = True):
+        if end <= start:
+            return
+        ci, cj = self._cell_of(self.store._x[start:end], self.store._y[start:end])
+        _, first, inverse = np.unique(_pack(ci, cj), return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        splits = np.cumsum(np.bincount(inverse))[:-1]
+        for i, j, members in zip(ci[first].tolist(), cj[first].tolist(), np.split(order + start, splits)):
+            self.cells.setdefault((i, j), []).extend(members.tolist())
+
+        bounds = (int(ci.min()), int(ci.max()), int(cj.min()), int(cj.max()))
+        if self._bounds is not None:
+            bounds = (min(bounds[0], self._bounds[0]), max(bounds[1], self._bounds[1]),
+                      min(bounds[2], self._bounds[2]), max(bounds[3], self._bounds[3]))
+        self._bounds = bounds
+        if not check_occupancy:
+            return
+        # des points alignés ou confondus restent mal répartis après un rebuild: sans ce palier
+        # chaque ajout referait toute la grille (coût quadratique), il reste amorti ici
+        if self.store.size < self.REBUILD_GROWTH * self._rebuilt_size:
+            return
+        occupancy = self.store.size / len(self.cells)
+        if occupancy > self.MAX_MEAN_OCCUPANCY or (self.store.size > 1000 and occupancy < self.MIN_MEAN_OCCUPANCY):
+            self.rebuild()
+
+    def rebuild(self):
+        """Recomputes the whole grid, with about TARGET_OCCUPANCY points per cell."""
+        self.cells, self._bounds = {}, None
+        self._rebuilt_size = self.store.size
+        if self.store.size == 0:
+            return
+        width = max(float(np.ptp(self.store.x)), float(np.ptp(self.store.y)), 1e-9)
+        self.cell_size = width / max(1.0, np.sqrt(self.store.size / self.TARGET_OCCUPANCY))
+        # insertion directe, sans nouveau contrôle d'occupation (répartition non uniforme)
+        self.insert(0, self.store.size, check_occupancy=False)
+
+    def _candidates(self, cells) -> np.ndarray:
+        members = [self.cells[c] for c in cells if c in self.cells]
+        if not members:
+            return np.empty(0, dtype=np.int64)
+        return np.fromiter((i for m in members for i in m), dtype=np.int64)
+
+    def in_box(self, x_min: float, y_min: float, x_max: float, y_max: float) -> np.ndarray:
+        """Indices of the points inside the box, in increasing order."""
+        if self._bounds is None:
+            return np.empty(0, dtype=np.int64)
+        (i0, i1), (j0, j1) = self._cell_of([x_min, x_max], [y_min, y_max])
+        i0, i1 = max(int(i0), self._bounds[0]), min(int(i1), self._bounds[1])
+        j0, j1 = max(int(j0), self._bounds[2]), min(int(j1), self._bounds[3])
+        if i0 > i1 or j0 > j1:
+            return np.empty(0, dtype=np.int64)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            cells = [c for c in self.cells if i0 <= c[0] <= i1 and j0 <= c[1] <= j1]
+        else:
+            cells = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+        candidates = self._candidates(cells)
+        x, y = self.store._x[candidates], self.store._y[candidates]
+        return np.sort(candidates[(x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max)])
+
+    def within_radius(self, x: float, y: float, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """Indices and distances of the points at most radius away, nearest first."""
+        candidates = self.in_box(x - radius, y - radius, x + radius, y + radius)
+        distances = np.hypot(self.store._x[candidates] - x, self.store._y[candidates] - y)
+        order = np.argsort(distances, kind="stable")
+        keep = distances[order] <= radius
+        return candidates[order][keep], distances[order][keep]
+
+    def nearest(self, x: float, y: float, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Indices and distances of the k nearest points, searching the grid ring by ring."""
+        if self._bounds is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        ci, cj = (int(c) for c in self._cell_of(x, y))
+        i_min, i_max, j_min, j_max = self._bounds
+        # les anneaux plus proches que la zone occupée sont vides
+        first_ring = max(0, i_min - ci, ci - i_max, j_min - cj, cj - j_max)
+        max_ring = max(abs(ci - i_min), abs(ci - i_max), abs(cj - j_min), abs(cj - j_max))
+        best, best_distances = np.empty(0, dtype=np.int64), np.empty(0)
+        visited = 0
+        for ring in range(first_ring, max_ring + 1):
+            # seules les cellules de l'anneau comprises dans la zone occupée sont parcourues
+            rows = range(max(ci - ring, i_min), min(ci + ring, i_max) + 1)
+            columns = range(max(cj - ring + 1, j_min), min(cj + ring - 1, j_max) + 1)
+            cells = [(i, j) for i in rows for j in {cj - ring, cj + ring} if j_min <= j <= j_max]
+            cells += [(i, j) for i in {ci - ring, ci + ring} if i_min <= i <= i_max for j in columns]
+            visited += len(cells)
+            if visited > len(self.cells) // 4:
+                # trop de cellules à parcourir: calcul direct sur toutes les distances
+                best = np.arange(self.store.size)
+                best_distances = np.hypot(self.store.x - x, self.store.y - y)
+                break
+            # fusion des nouveaux candidats avec les k meilleurs déjà trouvés
+            candidates = self._candidates(cells)
+            if len(candidates):
+                distances = np.hypot(self.store._x[candidates] - x, self.store._y[candidates] - y)
+                best = np.concatenate([best, candidates])
+                best_distances = np.concatenate([best_distances, distances])
+                if len(best) > k:
+                    keep = np.argpartition(best_distances, k - 1)[:k]
+                    best, best_distances = best[keep], best_distances[keep]
+            # les cellules des anneaux suivants sont au moins à ring * cell_size du point
+            if len(best) >= k and best_distances.max() <= ring * self.cell_size:
+                break
+        order = np.argsort(best_distances, kind="stable")[:k]
+        return best[order], best_distances[order]
+
+
+class PointStore:
+    """Columnar store of 2D points: two preallocated float arrays that grow by doubling."""
+
+    def __init__(self, capacity: int = 1024):
+        self._x = np.empty(capacity, dtype=np.float64)
+        self._y = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        self.index = GridIndex(self)
+
+    @classmethod
+    def from_points(cls, points: list[dict]) -> "PointStore":
+        store = cls(capacity=max(1024, len(points)))
+        store.add([p["x"] for p in points], [p["y"] for p in points])
+        return store
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._x[:self.size]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._y[:self.size]
+
+    def _reserve(self, capacity: int):
+        if capacity <= len(self._x):
+            return
+        new_capacity = max(capacity, 2 * len(self._x))
+        for name in ("_x", "_y"):
+            grown = np.empty(new_capacity, dtype=np.float64)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    def add(self, xs, ys) -> range:
+        """Appends the points, returns the indices they were given."""
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        ys = np.asarray(ys, dtype=np.float64).ravel()
+        if xs.shape != ys.shape:
+            raise ValueError("xs and ys must have the same length")
+        start = self.size
+        self._reserve(start + len(xs))
+        self._x[start:start + len(xs)] = xs
+        self._y[start:start + len(ys)] = ys
+        self.size += len(xs)
+        self.index.insert(start, self.size)
+        return range(start, self.size)
+
+    def remove(self, indices) -> int:
+        """Removes the points at the given indices (the following points are shifted), returns the count."""
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        indices = indices[(indices >= 0) & (indices < self.size)]
+        if len(indices) == 0:
+            return 0
+        keep = np.ones(self.size, dtype=bool)
+        keep[indices] = False
+        kept = int(keep.sum())
+        self._x[:kept] = self.x[keep]
+        self._y[:kept] = self.y[keep]
+        self.size = kept
+        self.index.rebuild()
+        return len(indices)
+
+    def filter(self, x_min=None, x_max=None, y_min=None, y_max=None) -> np.ndarray:
+        """Indices of the points inside the (optional) bounds."""
+        mask = np.ones(self.size, dtype=bool)
+        for values, low, high in ((self.x, x_min, x_max), (self.y, y_min, y_max)):
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        return np.flatnonzero(mask)
+
+    def summary(self, indices=None) -> dict:
+        x = self.x if indices is None else self.x[indices]
+        y = self.y if indices is None else self.y[indices]
+        if len(x) == 0:
+            return {"count": 0}
+        return {
+            "count": int(len(x)),
+            "bbox": {"x_min": float(x.min()), "x_max": float(x.max()), "y_min": float(y.min()), "y_max": float(y.max())},
+            "mean": {"x": float(x.mean()), "y": float(y.mean())},
+        }
+
+    def rows(self, indices) -> list[dict]:
+        return [{"index": int(i), "x": float(self._x[i]), "y": float(self._y[i])} for i in indices]
+
+    def to_frame(self, start: int = 0, end: int | None = None) -> pd.DataFrame:
+        end = self.size if end is None else end
+        return pd.DataFrame({"x": self._x[start:end], "y": self._y[start:end]})
+
+
+class ChartDownsampler:
+    """Reduces the points sent to a chart to about `budget` rows.
+
+    Above the budget the plane is cut in bins and only the first point of each
+    occupied bin is drawn. The bins already drawn are remembered, so new points
+    only produce a delta for the bins they newly occupy.
+    """
+
+    def __init__(self, budget: int = 5000):
+        self.budget = budget
+        self.bin_size = None  # None: every point is drawn
+        self.bins = set()
+        self.rendered_rows = 0
+
+    def _keys(self, x, y) -> np.ndarray:
+        return _pack(np.floor(x / self.bin_size), np.floor(y / self.bin_size))
+
+    def full(self, store: PointStore) -> pd.DataFrame:
+        """Frame to draw the whole chart."""
+        if len(store) <= self.budget:
+            self.bin_size, self.bins = None, set()
+            frame = store.to_frame()
+        else:
+            width = max(float(np.ptp(store.x)), float(np.ptp(store.y)), 1e-9)
+            self.bin_size = width / np.sqrt(self.budget)
+            keys, first = np.unique(self._keys(store.x, store.y), return_index=True)
+            self.bins = set(keys.tolist())
+            first.sort()
+            frame = pd.DataFrame({"x": store.x[first], "y": store.y[first]})
+        self.rendered_rows = len(frame)
+        return frame
+
+    def delta(self, store: PointStore, start: int) -> pd.DataFrame | None:
+        """Rows to add for the points from start, or None when the chart must be drawn again."""
+        if self.bin_size is None:
+            if len(store) > self.budget:
+                return None
+            frame = store.to_frame(start)
+        else:
+            x, y = store.x[start:], store.y[start:]
+            keys, first = np.unique(self._keys(x, y), return_index=True)
+            new = [i for key, i in zip(keys.tolist(), first.tolist()) if key not in self.bins]
+            if self.rendered_rows + len(new) > 2 * self.budget:
+                return None
+            self.bins.update(self._keys(x[new], y[new]).tolist())
+            new.sort()
+            frame = pd.DataFrame({"x": x[new], "y": y[new]})
+        self.rendered_rows += len(frame)
+        return frame
@@ -0,0 +1,100 @@
+import argparse
+import json
+import statistics
+from collections import defaultdict
+
+
+def read_spans(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def step_name(span: dict) -> str:
+    return f"{span['attributes']['process.step']}.{span['attributes']['process.function']}"
+
+
+def group_runs(spans: list[dict]) -> dict[str, dict]:
+    """Step and event spans of each run (a run is a trace)."""
+    runs = defaultdict(lambda: {"steps": [], "events": [], "topic": None, "start": None, "end": None})
+    for span in spans:
+        attributes = span["attributes"]
+        run = runs[span["trace_id"]]
+        if "process.step" in attributes:
+            run["steps"].append(span)
+        elif "process.event" in attributes:
+            run["events"].append(span)
+        run["topic"] = run["topic"] or attributes.get("process.topic")
+        if span["name"] == "article_process":
+            run["start"], run["end"] = span["start"], span["end"]
+    return {trace_id: run for trace_id, run in runs.items() if run["steps"]}
+
+
+def critical_path(run: dict) -> list[dict]:
+    """Chain of steps that determined the duration of the run, from the first to the last one.
+
+    The runtime delivers the events of a superstep once all its steps are done, so
+    a step is assumed to wait for the last event emitted before it started; the
+    step that emitted this event is its predecessor on the path.
+    """
+    steps = {span["span_id"]: span for span in run["steps"]}
+    current = max(run["steps"], key=lambda span: span["end"])
+    path = []
+    while current is not None:
+        triggers = [event for event in run["events"]
+                    if event["parent_id"] in steps and event["parent_id"] != current["span_id"]
+                    and event["end"] <= current["start"]]
+        trigger = max(triggers, key=lambda event: event["end"]) if triggers else None
+        path.append({"step": step_name(current),
+                     "duration": (current["end"] - current["start"]) / 1e9,
+                     "wait": (current["start"] - trigger["end"]) / 1e9 if trigger else 0.0,
+                     "event": trigger["attributes"]["process.event"] if trigger else None})
+        current = steps[trigger["parent_id"]] if trigger else None
+    return path[::-1]
+
+
+def print_run(trace_id: str, run: dict):
+    start = run["start"] or min(span["start"] for span in run["steps"])
+    end = run["end"] or max(span["end"] for span in run["steps"])
+    total = (end - start) / 1e9
+    path = critical_path(run)
+    print(f"run {trace_id[:8]} {run['topic'] or '-'!r}: {total:.2f} s, {len(run['steps'])} step(s)")
+    for item in path:
+        via = f"<- {item['event']} (+{item['wait'] * 1000:.1f} ms)" if item["event"] else ""
+        print(f"  {item['duration']:8.2f} s  {item['step']:<55} {via}")
+    slowest = max(path, key=lambda item: item["duration"])
+    routing = sum(item["wait"] for item in path)
+    print(f"  slowest step: {slowest['step']} ({slowest['duration']:.2f} s, "
+          f"{100 * slowest['duration'] / total if total else 0:.0f} % of the run), "
+          f"event routing on the path: {routing * 1000:.1f} ms")
+
+
+def print_summary(runs: dict[str, dict]):
+    durations = defaultdict(list)
+    on_path = defaultdict(float)
+    for run in runs.values():
+        for span in run["steps"]:
+            durations[step_name(span)].append((span["end"] - span["start"]) / 1e9)
+        for item in critical_path(run):
+            on_path[item["step"]] += item["duration"]
+
+    print(f"\n{len(runs)} run(s)")
+    print(f"  {'step':<55} {'count':>5} {'mean s':>8} {'p95 s':>8} {'max s':>8} {'on path s':>10}")
+    for name, values in sorted(durations.items(), key=lambda item: -on_path[item[0]]):
+        p95 = statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+        print(f"  {name:<55} {len(values):>5} {statistics.mean(values):>8.2f} {p95:>8.2f} "
+              f"{max(values):>8.2f} {on_path[name]:>10.2f}")
+    if on_path:
+        print(f"  slowest step on the critical paths: {max(on_path, key=on_path.get)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chemin critique des exécutions du process d'articles (spans JSONL)")
+    parser.add_argument("spans", help="fichier JSONL des spans (PROCESS_SPAN_FILE)")
+    parser.add_argument("--last", type=int, default=None, help="ne détailler que les N dernières exécutions")
+    args = parser.parse_args()
+
+    runs = group_runs(read_spans(args.spans))
+    ordered = sorted(runs.items(), key=lambda item: min(span["start"] for span in item[1]["steps"]))
+    for trace_id, run in ordered[-args.last:] if args.last else ordered:
+        print_run(trace_id, run)
+    print_summary(runs)
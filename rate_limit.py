@@ -0,0 +1,80 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """Delay requested by the service if exc (or one of its causes) is a 429, else None."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        status = getattr(exc, "status_code", None) or getattr(response, "status_code", None)
+        if status == 429:
+            headers = getattr(response, "headers", None) or {}
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                try:
+                    return float(headers["retry-after"])
+                except ValueError:
+                    pass
+            return 0.0
+        exc = exc.__cause__ or exc.__context__ or getattr(exc, "inner_exception", None)
+    return None
+
+
+class AsyncRateLimiter:
+    """Bounds the number of concurrent calls and their rate, and backs off on 429.
+
+    When one call is rate limited every call waits (the quota is shared by the
+    deployment), for the duration given by the Retry-After header or an
+    exponential backoff. The limiter can be shared by several event loops (one per
+    Streamlit rerun): the concurrency cap applies per loop, the pause and the rate
+    apply to all of them. A caller can pass its own, smaller, semaphore to run().
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: float | None = None,
+                 max_retries: int = 5, base_delay: float = 2.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self.max_concurrency = max_concurrency
+        self.throttled = 0
+        self._semaphores = weakref.WeakKeyDictionary()  # event loop -> semaphore
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+        self._paused_until = 0.0
+
+    async def _wait_turn(self):
+        now = time.monotonic()
+        start = max(now, self._next_start, self._paused_until)
+        self._next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        # un sémaphore asyncio est lié à la boucle qui l'utilise
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._semaphores[loop]
+
+    async def run(self, call, semaphore: asyncio.Semaphore | None = None):
+        """Runs call() (a coroutine factory) under the limits, retrying when rate limited."""
+        semaphore = semaphore or self._loop_semaphore()
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                await self._wait_turn()
+                try:
+                    return await call()
+                except Exception as exc:
+                    delay = retry_after(exc)
+                    if delay is None or attempt == self.max_retries:
+                        raise
+                    self.throttled += 1
+                    delay = max(delay, self.base_delay * 2 ** attempt) * random.uniform(1.0, 1.25)
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
@@ -0,0 +1,102 @@
+import math
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def name_tokens(name: str) -> list[str]:
+    """Tokens of an identifier or a question: snake_case and camelCase are split, plurals are dropped."""
+    words = re.findall(r"[a-z]+|[0-9]+", _CAMEL.sub(" ", name).lower())
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words]
+
+
+class SchemaCatalog:
+    """Lazy, cached description of the tables of a database.
+
+    Nothing is read before the first use. Columns are then kept until the definition
+    of their table changes (its SQL in sqlite_master, checked with a single cheap
+    query), so only new or altered tables are introspected again. A TF-IDF index
+    over the table and column names selects the tables relevant to a question.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.introspections = 0
+        self._signatures = {}  # table -> definition
+        self._columns = {}  # table -> [(name, type)]
+        self._index = None  # (idf, {table: tf})
+        self._lock = threading.Lock()
+
+    def _current_signatures(self) -> dict[str, str]:
+        if self.engine.dialect.name != "sqlite":
+            # pas de définition comparable: les tables connues sont supposées inchangées
+            return {name: self._signatures.get(name, "") for name in inspect(self.engine).get_table_names()}
+        with self.engine.connect() as connection:
+            rows = connection.execute(text("SELECT name, sql FROM sqlite_master "
+                                           "WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"))
+            return {name: sql or "" for name, sql in rows}
+
+    def _introspect(self, tables: list[str]) -> dict[str, list]:
+        if self.engine.dialect.name != "sqlite":
+            inspector = inspect(self.engine)
+            return {name: [(column["name"], column["type"]) for column in inspector.get_columns(name)] for name in tables}
+        # pragma_table_info: une requête légère par table, sans la réflexion complète de SQLAlchemy
+        with self.engine.connect() as connection:
+            return {name: [tuple(row) for row in connection.execute(
+                        text("SELECT name, type FROM pragma_table_info(:table) ORDER BY cid"), {"table": name})]
+                    for name in tables}
+
+    def refresh(self) -> list[str]:
+        """Introspects the new or changed tables only, returns their names."""
+        with self._lock:
+            signatures = self._current_signatures()
+            changed = [name for name, sql in signatures.items()
+                       if name not in self._columns or self._signatures.get(name) != sql]
+            removed = [name for name in self._columns if name not in signatures]
+            if changed:
+                self._columns.update(self._introspect(changed))
+                self.introspections += len(changed)
+            for name in removed:
+                del self._columns[name]
+            self._signatures = signatures
+            if changed or removed:
+                self._index = None
+            return changed
+
+    def columns(self, table: str) -> list[tuple[str, object]]:
+        self.refresh()
+        return self._columns[table]
+
+    def _build_index(self):
+        documents = {table: Counter(name_tokens(table) * 2 + [token for name, _ in columns for token in name_tokens(name)])
+                     for table, columns in self._columns.items()}
+        frequencies = Counter(token for document in documents.values() for token in document)
+        idf = {token: math.log((1 + len(documents)) / (1 + count)) + 1 for token, count in frequencies.items()}
+        return idf, documents
+
+    def relevant_tables(self, question: str, limit: int = 5) -> list[str]:
+        """Tables whose name or columns share the most (rare) words with the question; the first tables if none do."""
+        self.refresh()
+        with self._lock:
+            if self._index is None:
+                self._index = self._build_index()
+            idf, documents = self._index
+        words = set(name_tokens(question))
+        scores = {table: sum((1 + math.log(document[word])) * idf[word] for word in words if word in document)
+                  for table, document in documents.items()}
+        ranked = sorted((table for table in scores if scores[table] > 0), key=lambda table: -scores[table])
+        return ranked[:limit] or sorted(documents)[:limit]
+
+    def describe(self, tables: list[str]) -> str:
+        self.refresh()
+        descriptions = []
+        for table in tables:
+            columns = self._columns[table]
+            descriptions.append(f"Table '{table}':\n" +
+                                "Columns:\n" + "\n".join([f"  - {name}: {col_type}" for name, col_type in columns]))
+        return "\n\n".join(descriptions)
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncAzureOpenAI
+
+from telemetry import time_to_first_token, tokens_per_second
+
+load_dotenv()
+
+DEFAULT_API_VERSION = "2024-05-01-preview"
+
+
+class ServiceRegistry:
+    """Per-process registry of AI services sharing one pooled HTTP client.
+
+    Streamlit runs every rerun in a new event loop (asyncio.run), and an async HTTP
+    client cannot reuse its connections across loops. The registry therefore owns a
+    background event loop: services are created once, their calls run on that loop
+    and the pooled connections (and TLS sessions) survive reruns and sessions.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive_connections: int = 10):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="service-registry", daemon=True)
+        self._thread.start()
+        self._lock = threading.Lock()
+        self._services = {}
+        self._clients = {}
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.http_client = asyncio.run_coroutine_threadsafe(self._create_http_client(limits), self.loop).result()
+
+    @staticmethod
+    async def _create_http_client(limits: httpx.Limits) -> httpx.AsyncClient:
+        # created on the registry loop, where it will always be used
+        return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(60.0, connect=10.0))
+
+    def azure_openai_client(self, api_version: str | None = None) -> AsyncAzureOpenAI:
+        """Azure OpenAI client (one per api version) on top of the shared HTTP client."""
+        api_version = api_version or os.getenv("AZURE_OPENAI_API_VERSION", DEFAULT_API_VERSION)
+        with self._lock:
+            if api_version not in self._clients:
+                self._clients[api_version] = AsyncAzureOpenAI(
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    api_version=api_version,
+                    http_client=self.http_client,
+                )
+            return self._clients[api_version]
+
+    def get_service(self, service_id: str, factory):
+        """Returns the service registered under service_id, creating it with factory() the first time."""
+        with self._lock:
+            if service_id not in self._services:
+                self._services[service_id] = factory()
+            return self._services[service_id]
+
+    async def call(self, coro):
+        """Awaits a service coroutine on the registry loop from any other event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def stream(self, agen):
+        """Iterates a service async generator on the registry loop from any other event loop."""
+        caller_loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    caller_loop.call_soon_threadsafe(queue.put_nowait, (False, item))
+            except Exception as exc:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, (True, exc))
+            else:
+                caller_loop.call_soon_threadsafe(queue.put_nowait, (True, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                done, item = await queue.get()
+                if done:
+                    if item is not None:
+                        raise item
+                    return
+                yield item
+        finally:
+            # arrêt du flux si l'appelant s'interrompt (rerun streamlit, annulation...)
+            future.cancel()
+
+    async def stream_text(self, agen, on_text, attributes: dict) -> str:
+        """Streams chat message chunks from agen, calls on_text with the text received so far, returns the full text.
+
+        Time to first token and tokens/s are recorded with attributes.
+        """
+        start = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        async for chunk in self.stream(agen):
+            if chunk is None or not chunk.content:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                time_to_first_token.record(first_token_at - start, attributes)
+            chunks.append(chunk.content)
+            on_text("".join(chunks))
+
+        # un chunk correspond en pratique à un token
+        if first_token_at is not None and len(chunks) > 1:
+            generation_time = time.perf_counter() - first_token_at
+            if generation_time > 0:
+                tokens_per_second.record(len(chunks) / generation_time, attributes)
+        return "".join(chunks)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ServiceRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ServiceRegistry()
+        return _registry
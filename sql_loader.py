@@ -0,0 +1,102 @@
+import csv
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import islice
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection, Engine
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only needed for Parquet files
+    pq = None
+
+# réglages SQLite pour un chargement: pas d'attente du disque, journal en mémoire, gros cache de pages
+LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+    "temp_store": "MEMORY",
+    "cache_size": "-262144",  # 256 Mo
+}
+
+
+@dataclass(frozen=True)
+class LoadReport:
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.rows} rows loaded into '{self.table}' in {self.seconds:.2f} s ({self.rows_per_second:,.0f} rows/s)"
+
+
+def read_chunks(path: str, columns: list[str], chunk_size: int = 50_000):
+    """Yields the rows of a CSV, JSONL or Parquet file as lists of at most chunk_size tuples ordered like columns.
+
+    Missing columns and empty CSV cells are read as NULL (CSV and Parquet files must contain all the columns).
+    """
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise ImportError("pyarrow is required to read Parquet files (pip install pyarrow)")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield list(zip(*(batch.column(name).to_pylist() for name in columns)))
+        return
+
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.endswith(".csv"):
+            reader = csv.reader(file)
+            header = next(reader, [])
+            # les lignes CSV sont remises dans l'ordre des colonnes sans passer par des dicts,
+            # une cellule vide est NULL (et non un texte vide dans une colonne numérique)
+            indexes = [header.index(name) for name in columns]
+            rows = (tuple(row[i] or None for i in indexes) for row in reader)
+        else:
+            rows = (tuple(map(json.loads(line).get, columns)) for line in file if line.strip())
+        while chunk := list(islice(rows, chunk_size)):
+            yield chunk
+
+
+@contextmanager
+def loading_pragmas(connection: Connection):
+    """Applies LOAD_PRAGMAS on a SQLite connection for the duration of a load, then restores them."""
+    if connection.dialect.name != "sqlite":
+        yield
+        return
+    previous = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in LOAD_PRAGMAS}
+    for name, value in LOAD_PRAGMAS.items():
+        connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+    connection.commit()
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+        connection.commit()
+
+
+def bulk_insert(engine: Engine, table: Table, chunks) -> LoadReport:
+    """Inserts chunks of rows (lists of tuples in the order of the table columns) with executemany, in a single transaction."""
+    columns = [column.name for column in table.columns]
+    placeholder = "?" if engine.dialect.paramstyle == "qmark" else "%s"
+    statement = f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+    started = time.perf_counter()
+    count = 0
+    with engine.connect() as connection:
+        with loading_pragmas(connection), connection.begin():
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                # executemany du driver, sans compilation SQLAlchemy de chaque ligne
+                connection.exec_driver_sql(statement, chunk)
+                count += len(chunk)
+    return LoadReport(table.name, count, time.perf_counter() - started)
+
+
+def load_file(engine: Engine, table: Table, path: str, chunk_size: int = 50_000) -> LoadReport:
+    return bulk_insert(engine, table, read_chunks(path, [column.name for column in table.columns], chunk_size))
@@ -0,0 +1,194 @@
+import re
+import threading
+from collections import OrderedDict
+
+from sqlalchemy.engine import CursorResult
+
+NULL = "NULL"
+
+
+def format_value(value, max_chars: int = 80) -> str:
+    if value is None:
+        return NULL
+    text = str(value).replace("\n", "\\n").replace("|", "\\|")
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+
+class ColumnStats:
+    """Running min/max of a column (NULLs and values of mixed types are skipped)."""
+
+    def __init__(self):
+        self.min = None
+        self.max = None
+        self.nulls = 0
+
+    def add(self, value):
+        if value is None:
+            self.nulls += 1
+            return
+        try:
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        except TypeError:
+            pass
+
+
+def format_result(result: CursorResult, max_rows: int = 50, max_bytes: int = 8000, fetch_size: int = 500,
+                  max_scan_rows: int = 100_000) -> str:
+    """Compact text of a query result for a model: a header row, then one line per row, columns separated by "|".
+
+    Rows are fetched in batches (fetchmany) and at most max_rows rows / max_bytes bytes
+    are written; the remaining rows are only counted (up to max_scan_rows) and summarized
+    in a "truncated" footer. A last line gives the row count and per-column min/max
+    (labelled as partial when the scan stopped at max_scan_rows).
+    """
+    if not result.returns_rows:
+        return f"{result.rowcount} row(s) affected"
+
+    columns = list(result.keys())
+    stats = [ColumnStats() for _ in columns]
+    header = " | ".join(columns)
+    lines = [header]
+    size = len(header.encode("utf-8"))
+    shown = count = 0
+    exhausted = False
+    while batch := result.fetchmany(fetch_size):
+        for row in batch:
+            count += 1
+            for column_stats, value in zip(stats, row):
+                column_stats.add(value)
+            if shown < max_rows:
+                line = " | ".join(format_value(value) for value in row)
+                line_size = len(line.encode("utf-8")) + 1
+                if size + line_size <= max_bytes:
+                    lines.append(line)
+                    size += line_size
+                    shown += 1
+                else:
+                    # budget en octets atteint: les lignes suivantes sont seulement comptées
+                    max_rows = shown
+        if count >= max_scan_rows:
+            break
+    else:
+        exhausted = True
+    result.close()
+
+    if count > shown:
+        more = f"{count - shown}" if exhausted else f"at least {count - shown}"
+        lines.append(f"... truncated, {more} more rows")
+    hints = [f"{name}: {s.nulls} null" if s.min is None else
+             f"{name}: min {format_value(s.min, 40)}, max {format_value(s.max, 40)}" + (f", {s.nulls} null" if s.nulls else "")
+             for name, s in zip(columns, stats) if s.min is not None or s.nulls]
+    if hints and not exhausted:
+        hints[0] = f"min/max over the first {count} rows: {hints[0]}"
+    lines.append(f"-- {count if exhausted else f'at least {count}'} row(s)" + ("; " + "; ".join(hints) if hints else ""))
+    return "\n".join(lines)
+
+
+# littéraux (conservés tels quels) / reste de la requête (casse et espaces normalisés)
+_SQL_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_SQL_WORD = re.compile(r"\w+")
+_SQL_TABLE = re.compile(r"\b(?:from|join|into|update|table)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+_SQL_WRITE = re.compile(r"^\s*(insert|update|delete|replace|create|drop|alter)\b", re.IGNORECASE)
+_SQL_SCHEMA = re.compile(r"^\s*(create|drop|alter)\b", re.IGNORECASE)
+_SQL_VOLATILE = re.compile(r"\b(random|randomblob|changes|last_insert_rowid|current_(?:date|time|timestamp))\b",
+                           re.IGNORECASE)
+
+
+def normalize_sql(query: str) -> str:
+    """Same text for queries that only differ by case, spaces or a trailing semicolon (string literals are kept)."""
+    parts = _SQL_LITERAL.split(query.strip().rstrip(";"))
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part).lower() for i, part in enumerate(parts)).strip()
+
+
+def referenced_tables(query: str) -> set[str]:
+    """Tables written by a DML query (or read after FROM / JOIN)."""
+    return {name.lower() for name in _SQL_TABLE.findall(_SQL_LITERAL.sub("''", query))}
+
+
+def query_words(query: str) -> set[str]:
+    # tous les identifiants de la requête: une table lue (sous-requête, jointure par virgule, CTE...) n'est jamais oubliée
+    return {word.lower() for word in _SQL_WORD.findall(_SQL_LITERAL.sub("''", query))}
+
+
+def is_write(query: str) -> bool:
+    return bool(_SQL_WRITE.match(query))
+
+
+class QueryCache:
+    """LRU cache of formatted query results, invalidated per table on writes.
+
+    Entries are keyed on the normalized SQL text and remember the identifiers of the
+    query; a write to a table drops the entries that mention it (conservatively, a
+    column of the same name also counts), a schema change drops everything.
+    The cache is bounded both in entries and in total size of the cached texts.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 4_000_000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()  # sql -> (tables, text)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cacheable(query: str) -> bool:
+        return not (is_write(query) or _SQL_VOLATILE.search(_SQL_LITERAL.sub("''", query)) or "'now'" in query.lower())
+
+    def get(self, query: str) -> str | None:
+        key = normalize_sql(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, query: str, text: str):
+        key = normalize_sql(query)
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (query_words(query), text)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, table: str | None = None):
+        """Drops the entries that read table (every entry without a table)."""
+        with self._lock:
+            keys = [key for key, (words, _) in self._entries.items() if table is None or table.lower() in words]
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+
+    def invalidate_for(self, query: str):
+        """Invalidation after a write query: the tables it touches, or everything for a schema change."""
+        if _SQL_SCHEMA.match(query):
+            self.invalidate()
+        else:
+            for table in referenced_tables(query):
+                self.invalidate(table)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].encode("utf-8"))
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "entries": len(self._entries),
+                "bytes": self._bytes, "invalidations": self.invalidations}
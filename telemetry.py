@@ -1,5 +1,7 @@
+import json
 import logging
 import os
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -9,6 +11,7 @@ from azure.monitor.opentelemetry.exporter import (
     AzureMonitorTraceExporter,
 )
 
+from opentelemetry import metrics
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.metrics import set_meter_provider
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
@@ -18,7 +21,7 @@ from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.metrics.view import DropAggregation, View
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
 from opentelemetry.semconv.resource import ResourceAttributes
 from opentelemetry.trace import set_tracer_provider
 
@@ -29,6 +32,56 @@ connection_string = os.getenv("INSIGHT_CONNECTION_STRING")
 # Create a resource to represent the service/sample
 resource = Resource.create({ResourceAttributes.SERVICE_NAME: "telemetry-application-insights-quickstart"})
 
+# Metrics of the demos themselves (their names start with "demo" so that they are kept by the views below)
+meter = metrics.get_meter("semantic-kernel-demo")
+time_to_first_token = meter.create_histogram(
+    "demo.chat.time_to_first_token", unit="s", description="Time between the request and the first streamed token"
+)
+tokens_per_second = meter.create_histogram(
+    "demo.chat.tokens_per_second", unit="token/s", description="Streaming generation throughput"
+)
+prompt_tokens = meter.create_histogram(
+    "demo.chat.prompt_tokens", unit="token", description="Tokens of the chat history sent to the model per turn"
+)
+chart_payload_bytes = meter.create_histogram(
+    "demo.chart.payload_bytes", unit="By", description="Size of the data sent to a chart (full render or delta)"
+)
+chart_render_time = meter.create_histogram(
+    "demo.chart.render_time", unit="s", description="Time to prepare and send the data of a chart"
+)
+process_step_duration = meter.create_histogram(
+    "demo.process.step_duration", unit="s", description="Duration of a step function of a process"
+)
+process_setup_time = meter.create_histogram(
+    "demo.process.setup_time", unit="s", description="Time to get the kernel, services and process graph of a run"
+)
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Appends the finished spans to a local JSONL file, one span per line (read by process_report.py)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans) -> SpanExportResult:
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            for span in spans:
+                file.write(json.dumps({
+                    "name": span.name,
+                    "trace_id": format(span.context.trace_id, "032x"),
+                    "span_id": format(span.context.span_id, "016x"),
+                    "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+                    "start": span.start_time,
+                    "end": span.end_time,
+                    "status": span.status.status_code.name,
+                    "attributes": dict(span.attributes or {}),
+                }, ensure_ascii=False, default=str) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
 
 def set_up_logging():
     exporter = AzureMonitorLogExporter(connection_string=connection_string)
@@ -52,29 +105,36 @@ def set_up_logging():
     logger.setLevel(logging.INFO)
 
 
-def set_up_tracing():
-    exporter = AzureMonitorTraceExporter(connection_string=connection_string)
-
+def set_up_tracing(span_file: str | None = None):
     # Initialize a trace provider for the application. This is a factory for creating tracers.
     tracer_provider = TracerProvider(resource=resource)
     # Span processors are initialized with an exporter which is responsible
     # for sending the telemetry data to a particular backend.
-    tracer_provider.add_span_processor(BatchSpanProcessor(exporter))
+    if connection_string:
+        tracer_provider.add_span_processor(BatchSpanProcessor(AzureMonitorTraceExporter(connection_string=connection_string)))
+    # Optional local copy of the spans, for offline analysis
+    if span_file:
+        tracer_provider.add_span_processor(BatchSpanProcessor(JsonlSpanExporter(span_file)))
     # Sets the global default tracer provider
     set_tracer_provider(tracer_provider)
 
 
 def set_up_metrics():
-    exporter = AzureMonitorMetricExporter(connection_string=connection_string)
+    # Metrics are exported to App Insights only when a connection string is set (as for the traces)
+    metric_readers = []
+    if connection_string:
+        exporter = AzureMonitorMetricExporter(connection_string=connection_string)
+        metric_readers.append(PeriodicExportingMetricReader(exporter, export_interval_millis=5000))
 
     # Initialize a metric provider for the application. This is a factory for creating meters.
     meter_provider = MeterProvider(
-        metric_readers=[PeriodicExportingMetricReader(exporter, export_interval_millis=5000)],
+        metric_readers=metric_readers,
         resource=resource,
         views=[
-            # Dropping all instrument names except for those starting with "semantic_kernel"
+            # Dropping all instrument names except for those starting with "semantic_kernel" or "demo"
             View(instrument_name="*", aggregation=DropAggregation()),
             View(instrument_name="semantic_kernel*"),
+            View(instrument_name="demo*"),
         ],
     )
     # Sets the global default meter provider
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("semantic_kernel")
+
+from semantic_kernel.contents import ChatHistory, ChatMessageContent, FunctionCallContent, FunctionResultContent
+from semantic_kernel.contents.utils.author_role import AuthorRole
+
+from history_budget import SUMMARY_PREFIX, TokenBudgetReducer, history_tokens
+
+
+def tool_turn(history: ChatHistory, question: str, result: str):
+    history.add_user_message(question)
+    history.add_message(ChatMessageContent(role=AuthorRole.ASSISTANT, items=[
+        FunctionCallContent(id="call", name="points-search", arguments="{}")]))
+    history.add_message(ChatMessageContent(role=AuthorRole.TOOL, items=[
+        FunctionResultContent(id="call", name="points-search", result=result)]))
+
+
+def tool_results(history: ChatHistory) -> list[str]:
+    return [str(item.result) for message in history.messages for item in message.items
+            if isinstance(item, FunctionResultContent)]
+
+
+def test_short_history_keeps_recent_turns_verbatim():
+    history = ChatHistory()
+    tool_turn(history, "premier tour", "x" * 2000)
+    reducer = TokenBudgetReducer(token_budget=100, keep_recent_turns=2, summary_chars=20)
+
+    reducer.reduce(history)
+
+    assert tool_results(history) == ["x" * 2000]
+
+
+def test_older_turns_are_collapsed():
+    history = ChatHistory()
+    tool_turn(history, "premier tour", "x" * 2000)
+    tool_turn(history, "second tour", "y" * 2000)
+    # juste au-dessus du budget: résumer le premier tour suffit, aucun tour n'est supprimé
+    reducer = TokenBudgetReducer(token_budget=history_tokens(history) - 1, keep_recent_turns=1, summary_chars=20)
+
+    reducer.reduce(history)
+
+    first, second = tool_results(history)
+    assert first.startswith(SUMMARY_PREFIX)
+    assert second == "y" * 2000